@@ -0,0 +1,171 @@
+"""
+Transcription backends that turn an audio file into word-level timestamps.
+
+Every backend has the same interface:
+- model: name of the model, used in cache keys
+- settings(): every setting that affects the output, for cache keys
+- transcribe(audio_path): returns (words, text_segment) where
+    words is a list of {"word": str, "start": float, "end": float}
+    text_segment is {"text": str, "start": float, "end": float}
+
+The hosted backends call a Whisper API through the shared llm client,
+so they share rate limits and retries with the other stages. The local
+backend runs faster-whisper with int8 quantization on the CPU, in a
+pool of worker processes, so a bulk backfill isn't bound by provider
+rate limits or billing. faster-whisper is only needed for the local
+backend: pip install faster-whisper
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import llm
+
+RESPONSE_FORMAT = "verbose_json"
+TIMESTAMP_GRANULARITIES = ["word"]
+
+
+def make_text_segment(text, words, duration):
+    """
+    Build the text segment record that follows a chunk's words.
+    """
+    return {
+        "text": text,
+        "start": words[0]["start"] if words else 0,
+        "end": words[-1]["end"] if words else duration,
+    }
+
+
+class APIBackend:
+    """
+    Transcribe with a hosted Whisper model through litellm.
+
+    Args:
+        model (str): litellm model name
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def settings(self):
+        return dict(
+            model=self.model,
+            response_format=RESPONSE_FORMAT,
+            timestamp_granularities=TIMESTAMP_GRANULARITIES,
+        )
+
+    def transcribe(self, audio_path):
+        response = llm.transcription(
+            self.model,
+            audio_path,
+            response_format=RESPONSE_FORMAT,
+            timestamp_granularities=TIMESTAMP_GRANULARITIES,
+        )
+
+        words = []
+        for word in response.words:
+            words.append(
+                {
+                    "word": word["word"],
+                    "start": round(word["start"], 6),
+                    "end": round(word["end"], 6),
+                }
+            )
+
+        return words, make_text_segment(response.text, words, response.duration)
+
+
+class LocalBackend:
+    """
+    Transcribe on the local CPU with faster-whisper.
+
+    Each worker process loads the model once and then transcribes one
+    chunk at a time. The pool is sized so the workers' threads together
+    use all the cores.
+
+    Args:
+        model_size (str): faster-whisper model, e.g. "large-v3" or "medium.en"
+        compute_type (str): Quantization to run the model with
+        cpu_threads (int): Threads used by each worker process
+        workers (int): Number of worker processes, defaults to cores / cpu_threads
+    """
+
+    def __init__(
+        self, model_size="large-v3", compute_type="int8", cpu_threads=4, workers=None
+    ):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.workers = workers or max(1, (os.cpu_count() or 1) // cpu_threads)
+        self.model = f"faster-whisper/{model_size}-{compute_type}"
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def settings(self):
+        return dict(model=self.model)
+
+    def transcribe(self, audio_path):
+        with self.lock:
+            if self.pool is None:
+                print(f"Starting {self.workers} local transcription workers")
+                # Spawn rather than fork, since the caller is multithreaded
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+
+        future = self.pool.submit(
+            local_transcribe,
+            audio_path,
+            self.model_size,
+            self.compute_type,
+            self.cpu_threads,
+        )
+        return future.result()
+
+
+# The faster-whisper model loaded in this worker process
+local_model = None
+
+
+def local_transcribe(audio_path, model_size, compute_type, cpu_threads):
+    """
+    Transcribe one file in a worker process, loading the model on first use.
+    """
+    global local_model
+    if local_model is None:
+        from faster_whisper import WhisperModel
+
+        local_model = WhisperModel(
+            model_size,
+            device="cpu",
+            compute_type=compute_type,
+            cpu_threads=cpu_threads,
+        )
+
+    segments, info = local_model.transcribe(audio_path, word_timestamps=True)
+
+    words = []
+    texts = []
+    for segment in segments:
+        texts.append(segment.text)
+        for word in segment.words:
+            words.append(
+                {
+                    "word": word.word,
+                    "start": round(word.start, 6),
+                    "end": round(word.end, 6),
+                }
+            )
+
+    text = "".join(texts).strip()
+    return words, make_text_segment(text, words, info.duration)
+
+
+BACKENDS = {
+    "fireworks": APIBackend("fireworks_ai/whisper-v3"),
+    "groq": APIBackend("groq/whisper-large-v3-turbo"),
+    "local": LocalBackend(),
+}
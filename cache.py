@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+
+"""
+Content-addressed on-disk cache for expensive API results.
+
+Each entry is a JSON file named by the SHA-256 hash of everything that
+determines the result (e.g. the audio bytes of a chunk and the model
+settings used to transcribe it). The cache is bounded in size: when it
+grows past its limit, the least recently used entries are evicted.
+Recency is tracked with the file modification times, which are refreshed
+on every hit.
+
+LLM completions are cached in a single SQLite database instead, since
+there are many more of them and each one is small. Entries expire after
+a time to live, and the least recently used are evicted past a size limit.
+In replay mode the database is opened read-only: hits are served, nothing
+is written, and a miss is an error rather than a new API call.
+
+Run as a script to inspect or clear a cache:
+
+    ./cache.py stats
+    ./cache.py clear
+    ./cache.py stats --completions
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_DIR = ".cache/transcriptions"
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+DEFAULT_COMPLETIONS_PATH = ".cache/completions.sqlite"
+DEFAULT_COMPLETIONS_MAX_BYTES = 100 * 1024 * 1024
+DEFAULT_COMPLETIONS_TTL_SEC = 90 * 24 * 60 * 60
+
+
+class DiskCache:
+    """
+    Size-bounded LRU cache of JSON values stored as files in a directory.
+
+    Args:
+        directory (str): Directory holding the cache entries
+        max_bytes (int): Total size of entries to keep before evicting
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(data, **params):
+        """
+        Build a cache key from raw bytes plus the parameters that affect the result.
+
+        Args:
+            data (bytes-like): Content to hash, e.g. chunk audio bytes
+            **params: JSON-serializable settings, e.g. model and response format
+
+        Returns:
+            str: Hex SHA-256 digest
+        """
+        digest = hashlib.sha256()
+        digest.update(data)
+        digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        """
+        Look up a cached value, marking it as recently used.
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Store a value, then evict old entries if the cache is over its size limit.
+        """
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Atomic write, so a crash never leaves a truncated entry behind
+        temp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(value, f)
+        os.replace(temp_path, path)
+
+        self.evict()
+
+    def entries(self):
+        """
+        List all cache entries as (mtime, size, path), oldest first.
+        """
+        entries = []
+        if not self.directory.exists():
+            return entries
+
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits in max_bytes.
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self.lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+
+            removed = 0
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+
+        return removed
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        for _, _, path in self.entries():
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """
+        Summarize the cache contents and this process's hit/miss counts.
+
+        Returns:
+            dict: Entry count, total and maximum size, hits and misses
+        """
+        entries = self.entries()
+        return {
+            "directory": str(self.directory),
+            "entries": len(entries),
+            "total_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CompletionCache:
+    """
+    Size-bounded LRU cache of LLM completions in a SQLite database.
+
+    Args:
+        path (str): SQLite database file
+        max_bytes (int): Total size of cached responses to keep before evicting
+        ttl_sec (float): Age after which an entry is ignored, or None to keep forever
+        replay (bool): Open read-only; never write, refresh or expire entries
+    """
+
+    def __init__(
+        self,
+        path=DEFAULT_COMPLETIONS_PATH,
+        max_bytes=DEFAULT_COMPLETIONS_MAX_BYTES,
+        ttl_sec=DEFAULT_COMPLETIONS_TTL_SEC,
+        replay=False,
+    ):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.ttl_sec = ttl_sec
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if replay:
+            uri = f"file:{self.path}?mode=ro"
+            self.db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT,"
+                " response TEXT,"
+                " size INTEGER,"
+                " created REAL,"
+                " used REAL)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS completions_used ON completions (used)"
+            )
+
+    @staticmethod
+    def key(model, messages, **params):
+        """
+        Build a cache key from the model, the messages and the request settings.
+
+        Returns:
+            str: Hex SHA-256 digest
+        """
+        request = dict(model=model, messages=messages, **params)
+        data = json.dumps(request, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, key):
+        """
+        Look up a cached response, marking it as recently used.
+
+        Entries past the TTL count as misses, except in replay mode, where
+        every stored reply is served.
+
+        Returns:
+            dict: The cached response, or None on a miss or if it has expired
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT response, created FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+
+            now = time.time()
+            expired = row and self.ttl_sec and row[1] < now - self.ttl_sec
+            if expired and not self.replay:
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+
+            if not self.replay:
+                with self.db:
+                    self.db.execute(
+                        "UPDATE completions SET used = ? WHERE key = ?", (now, key)
+                    )
+            self.hits += 1
+
+        return json.loads(row[0])
+
+    def put(self, key, model, response):
+        """
+        Store a response, then evict entries that expired or don't fit.
+        """
+        if self.replay:
+            return
+
+        data = json.dumps(response)
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, data, len(data), now, now),
+            )
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove expired entries, then the least recently used ones until the
+        cache fits in max_bytes.
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self.lock, self.db:
+            removed = 0
+            if self.ttl_sec:
+                cursor = self.db.execute(
+                    "DELETE FROM completions WHERE created < ?",
+                    (time.time() - self.ttl_sec,),
+                )
+                removed += cursor.rowcount
+
+            (total,) = self.db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM completions"
+            ).fetchone()
+            if total <= self.max_bytes:
+                return removed
+
+            rows = self.db.execute(
+                "SELECT key, size FROM completions ORDER BY used"
+            ).fetchall()
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self.db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+
+        return removed
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM completions")
+
+    def stats(self):
+        """
+        Summarize the cache contents and this process's hit/miss counts.
+
+        Returns:
+            dict: Entry count, total and maximum size, hits and misses
+        """
+        with self.lock:
+            entries, total = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions"
+            ).fetchone()
+
+        return {
+            "directory": str(self.path),
+            "entries": entries,
+            "total_bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def print_stats(stats):
+    """
+    Print cache statistics in a readable form.
+    """
+    print(f"Cache: {stats['directory']}")
+    print(f"Entries: {stats['entries']:,}")
+    print(
+        f"Size: {stats['total_bytes']/(1024*1024):.1f}MB"
+        f" of {stats['max_bytes']/(1024*1024):.1f}MB"
+    )
+    lookups = stats["hits"] + stats["misses"]
+    if lookups:
+        print(
+            f"Hits: {stats['hits']:,} / {lookups:,}"
+            f" ({100 * stats['hits'] / lookups:.1f}%)"
+        )
+
+
+def main():
+    """
+    Command line interface to show cache statistics or clear the cache.
+    """
+    parser = argparse.ArgumentParser(description="Inspect or clear the API cache")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--dir", default=DEFAULT_DIR, help="Cache directory")
+    parser.add_argument(
+        "--completions",
+        action="store_true",
+        help=f"Use the LLM completion cache in {DEFAULT_COMPLETIONS_PATH} instead",
+    )
+    args = parser.parse_args()
+
+    if args.completions:
+        cache = CompletionCache()
+        location = DEFAULT_COMPLETIONS_PATH
+    else:
+        cache = DiskCache(args.dir)
+        location = args.dir
+
+    if args.command == "clear":
+        cache.clear()
+        print(f"Cleared {location}")
+    else:
+        print_stats(cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Propose where questions start in an AMA transcript, without an LLM.
+
+Sean opens nearly every question the same way: "Raul says ...",
+"AbacusPowerUser asks ...", "Jane's question is ...", "I'm going to group
+two questions together ...". A few compiled regexes find those openings
+in the .punct.jsonl words. Each match is scored with simple features: a
+speaker name capitalized mid-sentence and a match at the start of a
+sentence both count for it, common words in the name slot ("he says",
+"the paper says") count against it.
+
+segment.py can use the candidates in place of its rough pass, asking the
+LLM only to confirm small windows around them. Run this module as a
+script to measure recall against existing .segments.jsonl outputs:
+
+    ./candidates.py data/*.mp3
+"""
+
+import re
+from bisect import bisect_right
+from pathlib import Path
+
+import jsonlines
+
+# Up to three words starting with a capital, or one or two lowercase words
+NAME = (
+    r"(?<![\w'.-])(?P<name>[A-Z0-9][\w'.-]*(?: [\w'.-]+){0,2}"
+    r"|[a-z][\w'-]*(?: [a-z][\w'-]*)?)"
+)
+
+VERBS = (
+    r"says|said|saying|asks|asked|writes|wonders|is wondering|wants to know"
+    r"|wanted to know|gives us|gets the honors|has a(?: priority)? question"
+)
+
+# (pattern, base score); a candidate needs MIN_SCORE to be proposed
+PATTERNS = [
+    (re.compile(NAME + r",? (?:" + VERBS + r")\b"), 1),
+    (re.compile(NAME + r"'s (?:priority )?questions?\b"), 1),
+    (re.compile(r"\bis from " + NAME), 1),
+    (
+        re.compile(
+            r"\b(?:group|grouping|combine|combining)\b[^.?!]{0,40}\bquestions?\b",
+            re.IGNORECASE,
+        ),
+        2,
+    ),
+    (re.compile(r"\bquestions? (?:that I'm |I'm )?(?:grouping|grouped)\b"), 2),
+    (re.compile(r"\bquestion comes from " + NAME), 1),
+    (re.compile(r"\b(?:next|first|final|last) question (?:is|comes)\b"), 2),
+]
+
+MIN_SCORE = 2
+
+# Words that fill the name slot but are never a listener's name
+NOT_NAMES = {
+    "he", "she", "it", "they", "you", "i", "we", "that", "this", "who",
+    "which", "one", "someone", "everyone", "nobody", "people", "paper",
+    "book", "theory", "argument", "story", "article", "law", "rule", "and",
+    "but", "so", "then", "also", "just", "what", "einstein", "god", "the",
+    "a", "an", "my", "his", "her", "your", "their", "our", "there", "here",
+}  # fmt: skip
+
+# Candidates closer than this many words are one question, e.g. a group
+MERGE_WORDS = 40
+
+# Words around a candidate that the LLM is asked to confirm
+WINDOW_BEFORE_WORDS = 20
+WINDOW_AFTER_WORDS = 250
+
+# A segment counts as recalled if a candidate is within this many words
+RECALL_WORDS = 20
+
+
+def find_candidates(words):
+    """
+    Find likely question starts in a transcript.
+
+    Args:
+        words: List of word dicts with a "text" field
+
+    Returns:
+        list: Sorted word indexes of the candidate question starts
+    """
+    starts = []
+    pieces = []
+    position = 0
+    for w in words:
+        starts.append(position)
+        pieces.append(w["text"])
+        position += len(w["text"])
+    text = "".join(pieces)
+
+    scored = []
+    for pattern, base in PATTERNS:
+        for match in pattern.finditer(text):
+            if candidate_score(text, match, base) >= MIN_SCORE:
+                word = max(0, bisect_right(starts, match.start()) - 1)
+                scored.append(word)
+
+    candidates = []
+    for word in sorted(scored):
+        if candidates and word - candidates[-1] <= MERGE_WORDS:
+            continue
+        candidates.append(word)
+
+    return candidates
+
+
+def candidate_score(text, match, base):
+    """
+    Score a pattern match using the capitalization and position of the name.
+    """
+    score = base
+    at_sentence_start = sentence_start(text, match.start())
+    if at_sentence_start:
+        score += 1
+
+    name = match.groupdict().get("name")
+    if name:
+        # Drop leading filler, as in "And Raul says"
+        words = name.split()
+        while words and words[0].lower() in NOT_NAMES:
+            words.pop(0)
+        if not words:
+            return 0
+
+        # A capital means a name, unless it just starts the sentence
+        first_in_sentence = at_sentence_start and len(words) == len(name.split())
+        if words[0][0].isupper() and not first_in_sentence:
+            score += 1
+
+    return score
+
+
+def sentence_start(text, position):
+    """
+    Check whether a position in the text starts a sentence.
+    """
+    before = text[:position].rstrip()
+    return not before or before[-1] in ".?!…"
+
+
+def candidate_windows(candidates, num_words):
+    """
+    Group candidates into the windows of words the LLM is asked to confirm.
+
+    Returns:
+        list: (start, end) word ranges, merged where they overlap
+    """
+    windows = []
+    for word in candidates:
+        start = max(0, word - WINDOW_BEFORE_WORDS)
+        end = min(num_words, word + WINDOW_AFTER_WORDS)
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], end)
+        else:
+            windows.append((start, end))
+
+    return windows
+
+
+def recall(candidates, question_indexes):
+    """
+    Compare candidates to the question starts found by full segmentation.
+
+    Returns:
+        tuple: (questions recalled, candidates matching a question)
+    """
+    recalled = 0
+    for q_index in question_indexes:
+        if any(abs(q_index - c) <= RECALL_WORDS for c in candidates):
+            recalled += 1
+
+    matched = 0
+    for c in candidates:
+        if any(abs(q_index - c) <= RECALL_WORDS for q_index in question_indexes):
+            matched += 1
+
+    return recalled, matched
+
+
+def main():
+    """
+    Report candidate recall for episodes that have already been segmented.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Measure question-candidate recall against existing segments"
+    )
+    parser.add_argument("files", nargs="+", help="Episode files to check")
+    args = parser.parse_args()
+
+    total_questions = total_recalled = total_candidates = total_matched = 0
+    for input_file in args.files:
+        base_path = Path(input_file).with_suffix("")
+        words_path = base_path.with_suffix(".punct.jsonl")
+        segments_path = base_path.with_suffix(".segments.jsonl")
+
+        if not words_path.exists() or not segments_path.exists():
+            print(f"Skipping {base_path}: needs {words_path} and {segments_path}")
+            continue
+
+        with jsonlines.open(words_path) as reader:
+            words = list(reader)
+        with jsonlines.open(segments_path) as reader:
+            question_indexes = [segment["question_index"] for segment in reader]
+
+        candidates = find_candidates(words)
+        recalled, matched = recall(candidates, question_indexes)
+        windows = candidate_windows(candidates, len(words))
+        print(
+            f"{base_path}: {recalled}/{len(question_indexes)} questions recalled,"
+            f" {matched}/{len(candidates)} candidates matched,"
+            f" {len(windows)} windows"
+        )
+
+        total_questions += len(question_indexes)
+        total_recalled += recalled
+        total_candidates += len(candidates)
+        total_matched += matched
+
+    if total_questions:
+        print(
+            f"Recall: {total_recalled}/{total_questions}"
+            f" ({100 * total_recalled / total_questions:.1f}%)"
+        )
+    if total_candidates:
+        print(
+            f"Precision: {total_matched}/{total_candidates}"
+            f" ({100 * total_matched / total_candidates:.1f}%)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Plan where to cut an episode into chunks for transcription.
+
+Two planners are provided, both working on an MP3 FrameIndex so every
+cut lands on a frame boundary:
+- plan_fixed_chunks: fixed-duration chunks with a fixed overlap
+- plan_silence_chunks: chunks as large as the upload size limit allows,
+  cut at the quietest point near the limit. When that point is clean
+  silence, no word can straddle the cut, so the overlap is dropped.
+
+Only the few seconds of audio around each candidate cut are decoded,
+never the whole episode.
+"""
+
+from bisect import bisect_right
+from io import BytesIO
+
+import numpy as np
+from pydub import AudioSegment
+
+# Stay safely under the 25MB upload limit of the transcription API
+MAX_CHUNK_BYTES = 24 * 1024 * 1024
+
+# Sample rate to decode at for energy scans; speech pauses show up fine at 8kHz
+SCAN_SAMPLE_RATE = 8000
+
+
+def plan_fixed_chunks(index, chunk_sec=10 * 60, overlap_sec=10):
+    """
+    Plan fixed-duration chunks that overlap by a fixed amount.
+
+    Args:
+        index (FrameIndex): Frame index of the episode
+        chunk_sec (float): Duration of each chunk in seconds
+        overlap_sec (float): Overlap between consecutive chunks in seconds
+
+    Returns:
+        list: (start_frame, end_frame) for each chunk
+    """
+    chunks = []
+    position = 0
+    while position < index.duration:
+        end = min(position + chunk_sec, index.duration)
+        start_frame = index.frame_at_time(position)
+        end_frame = index.frame_at_time(end)
+        if end_frame < len(index) and index.frame_time(end_frame) < end:
+            end_frame += 1
+        chunks.append((start_frame, end_frame))
+        position += chunk_sec - overlap_sec
+
+    return chunks
+
+
+def plan_silence_chunks(
+    mp3,
+    index,
+    max_bytes=MAX_CHUNK_BYTES,
+    max_sec=None,
+    search_sec=60,
+    overlap_sec=10,
+    clean_overlap_sec=0,
+    silence_db=-40,
+):
+    """
+    Plan chunks that fill the upload limit and end at the quietest nearby point.
+
+    For each chunk, the planner finds the last frame that keeps the chunk
+    under max_bytes (and max_sec, if given). It then scans the preceding
+    search_sec of audio for the quietest moment. If that moment is below
+    silence_db, the chunk is cut there with clean_overlap_sec of overlap.
+    Otherwise it falls back to cutting at the limit with overlap_sec of
+    overlap, so the stitching stage can still merge the boundary.
+
+    Args:
+        mp3 (bytes-like): MP3 file content
+        index (FrameIndex): Frame index of the episode
+        max_bytes (int): Maximum size of a chunk in bytes
+        max_sec (float): Optional maximum duration of a chunk in seconds
+        search_sec (float): How far before the limit to look for a quiet cut
+        overlap_sec (float): Overlap to use when no silence is found
+        clean_overlap_sec (float): Overlap to use when cutting in silence
+        silence_db (float): Level in dBFS below which a moment counts as silent
+
+    Returns:
+        list: (start_frame, end_frame) for each chunk
+    """
+    num_frames = len(index)
+    chunks = []
+    start = 0
+    while start < num_frames:
+        end = bisect_right(index.offsets, index.offsets[start] + max_bytes) - 1
+        if max_sec:
+            end = min(end, index.frame_at_time(index.frame_time(start) + max_sec))
+        end = min(end, num_frames)
+
+        if end >= num_frames:
+            chunks.append((start, num_frames))
+            break
+
+        # Never search the first half of the chunk, so chunks stay large
+        start_sec = index.frame_time(start)
+        limit_sec = index.frame_time(end)
+        search_start = max((start_sec + limit_sec) / 2, limit_sec - search_sec)
+        cut_sec, level = find_quietest(mp3, index, search_start, limit_sec)
+
+        if level <= silence_db:
+            cut = index.frame_at_time(cut_sec)
+            next_start = index.frame_at_time(cut_sec - clean_overlap_sec)
+            print(f"Cutting at {cut_sec:.2f}s in silence ({level:.1f} dBFS)")
+        else:
+            cut = end
+            next_start = index.frame_at_time(limit_sec - overlap_sec)
+            print(f"No silence before {limit_sec:.2f}s ({level:.1f} dBFS), overlapping")
+
+        chunks.append((start, cut))
+        start = max(next_start, start + 1)
+
+    return chunks
+
+
+def find_quietest(mp3, index, start_sec, end_sec, window_sec=0.3):
+    """
+    Find the quietest moment in a span of the episode.
+
+    Args:
+        mp3 (bytes-like): MP3 file content
+        index (FrameIndex): Frame index of the episode
+        start_sec (float): Start of the span to scan
+        end_sec (float): End of the span to scan
+        window_sec (float): Length of the moving window the level is averaged over
+
+    Returns:
+        tuple: (time in seconds, level in dBFS) of the quietest window's center
+    """
+    start_byte, end_byte, actual_start, _ = index.byte_range(start_sec, end_sec)
+    samples = decode_pcm(mp3[start_byte:end_byte])
+
+    power, hop_sec = frame_power(samples)
+    if not len(power):
+        return end_sec, 0.0
+
+    # Average over a window long enough to skip gaps inside words
+    width = max(1, min(int(window_sec / hop_sec), len(power)))
+    smoothed = np.convolve(power, np.ones(width) / width, mode="valid")
+    quietest = int(np.argmin(smoothed))
+
+    center = quietest + width / 2
+    cut_sec = actual_start + center * hop_sec
+    return min(cut_sec, end_sec), power_to_db(smoothed[quietest])
+
+
+def decode_pcm(data, sample_rate=SCAN_SAMPLE_RATE):
+    """
+    Decode a slice of MP3 frames to mono float samples in [-1, 1].
+
+    Args:
+        data (bytes-like): Whole MP3 frames
+        sample_rate (int): Sample rate to resample to
+
+    Returns:
+        numpy.ndarray: float32 samples
+    """
+    audio = AudioSegment.from_file(BytesIO(bytes(data)), format="mp3")
+    audio = audio.set_channels(1).set_frame_rate(sample_rate)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    return samples / float(1 << (8 * audio.sample_width - 1))
+
+
+def frame_power(samples, sample_rate=SCAN_SAMPLE_RATE, hop_sec=0.02):
+    """
+    Compute the mean power of consecutive short frames of audio.
+
+    Returns:
+        tuple: (numpy.ndarray of per-frame power, frame length in seconds)
+    """
+    hop = int(sample_rate * hop_sec)
+    num = len(samples) // hop
+    frames = samples[: num * hop].reshape(num, hop)
+    return np.mean(frames**2, axis=1), hop_sec
+
+
+def power_to_db(power):
+    return float(10 * np.log10(power + 1e-12))
@@ -3,10 +3,9 @@
 # Script to process podcast episode files through the full pipeline:
 # 1. Transcription
 # 2. Punctuation correction
-# 3. Segmentation
-# 4. Summarization
-# 5. Synchronization
-# 6. Final HTML rendering
+# 3. Segmentation and summarization
+# 4. Synchronization
+# 5. Final HTML rendering
 
 # Exit immediately if any command fails
 set -e
@@ -23,6 +22,7 @@ if [ -z "$1" ]; then
     echo "Usage: $0 [--force] <input_file> [input_file2 ...]"
     echo "Example: $0 data/2024-12-AMA.mp3 data/2024-11-AMA.mp3"
     echo "  --force   Force reprocessing even if intermediate files exist"
+    echo "Set PIPELINE_FLAGS to pass options to pipeline.py, e.g. PIPELINE_FLAGS=\"--verify head\""
     exit 1
 fi
 
@@ -42,8 +42,7 @@ for input_file in "$@"; do
     # Run each processing step:
     ./transcribe.py $force_flag "$input_file"
     ./punct.py "$input_file"
-    ./segment.py $force_flag "$input_file"
-    ./summarize.py $force_flag "$input_file"
+    ./pipeline.py $force_flag $PIPELINE_FLAGS "$input_file"
     ./fingerprint.py "$input_file"
     ./sync.py $input_file
 done
@@ -5,18 +5,28 @@ fingerprint.py - Audio Segment Fingerprinting Tool
 
 This script adds audio fingerprints to segment data by:
 1. Reading segment timestamps from JSONL file
-2. Calculating byte offsets in the corresponding MP3 file
-3. Extracting 128-byte fingerprints at each segment start
+2. Finding the MP3 frame that contains each segment start
+3. Extracting 128-byte fingerprints at the start of that frame
 4. Adding base64-encoded fingerprints to each segment record
 5. Writing updated records to a new fingerprints.jsonl file
+
+The MP3 is memory-mapped, so only the pages under each fingerprint are
+read from disk. Times are mapped to frames with the episode's frame
+index, saved next to its .json metadata, so the frame headers are only
+scanned the first time. Each record also gets the byte offset of its
+fingerprint, which sync.py uses to compute exact times. Episodes are
+fingerprinted in parallel, one per worker process.
 """
 
 import argparse
 import base64
 import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-from mutagen.mp3 import MP3
+from mp3frames import cached_frame_index, open_mp3
 
 
 def get_fingerprint(mp3_bytes, offset, length=128):
@@ -24,7 +34,7 @@ def get_fingerprint(mp3_bytes, offset, length=128):
     Extract a fingerprint from MP3 bytes at given offset.
 
     Args:
-        mp3_bytes (bytes): The MP3 file content
+        mp3_bytes (bytes-like): The MP3 file content, e.g. a memory map
         offset (int): Byte position to start fingerprint
         length (int): Number of bytes for fingerprint
 
@@ -43,11 +53,27 @@ def main():
         description="Add audio fingerprints to segment data"
     )
     parser.add_argument("files", nargs="+", help="Files to process")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of episodes to fingerprint at once (default: one per CPU)",
+    )
     args = parser.parse_args()
 
-    for fname in args.files:
-        print(f"\nProcessing {fname}...")
-        process(fname)
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {fname: pool.submit(process, fname) for fname in args.files}
+        for fname, future in futures.items():
+            try:
+                future.result()
+                print(f"Fingerprinted {fname}")
+            except Exception as e:
+                print(f"Error fingerprinting {fname}: {e}")
+                failed.append(fname)
+
+    if failed:
+        sys.exit(1)
 
 
 def process(fname):
@@ -61,17 +87,32 @@ def process(fname):
     mp3_file = base_path.with_suffix(".mp3")
     segments_file = base_path.with_suffix(".summarized.jsonl")
     fingerprints_file = base_path.with_suffix(".fingerprints.jsonl")
+    timestamps_file = base_path.with_suffix(".timestamps.json")
+
+    # Map the MP3 file; once it is indexed, only the fingerprinted pages are read
+    with open_mp3(mp3_file) as mp3_bytes:
+        index = cached_frame_index(mp3_file, mp3_bytes)
+        fingerprint_segments(
+            mp3_bytes, index, segments_file, fingerprints_file, timestamps_file
+        )
 
-    # Read the MP3 file
-    mp3_bytes = Path(mp3_file).read_bytes()
 
-    # Calculate bytes per second from MP3 duration
+def fingerprint_segments(
+    mp3_bytes, index, segments_file, fingerprints_file, timestamps_file
+):
+    """
+    Fingerprint each segment and record its start time under the fingerprint.
+
+    Args:
+        mp3_bytes (bytes-like): The MP3 file content
+        index (FrameIndex): Frame index of the MP3
+        segments_file (Path): Input .summarized.jsonl file
+        fingerprints_file (Path): Output .fingerprints.jsonl file
+        timestamps_file (Path): .timestamps.json file to update
+    """
     total_bytes = len(mp3_bytes)
-    audio = MP3(mp3_file)
-    bytes_per_sec = total_bytes / audio.info.length
 
     # Load existing timestamps if file exists
-    timestamps_file = base_path.with_suffix(".timestamps.json")
     timestamps = {}
     if timestamps_file.exists():
         with open(timestamps_file) as f:
@@ -83,12 +124,13 @@ def process(fname):
             segment = json.loads(line)
             start_sec = segment["start"]
 
-            # Calculate byte offset
-            offset = int(start_sec * bytes_per_sec)
+            # Start of the frame that contains the segment start
+            offset = index.byte_at_time(start_sec)
 
             # Get fingerprint and add to segment
             fingerprint = get_fingerprint(mp3_bytes, offset)
             segment["fingerprint"] = fingerprint
+            segment["offset"] = offset
 
             # Write updated segment
             outfile.write(json.dumps(segment) + "\n")
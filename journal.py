@@ -0,0 +1,79 @@
+"""
+Append-only job journal for resumable, chunked processing.
+
+Each finished chunk is appended to a JSONL file as soon as its result
+comes back, and flushed to disk right away. If a run crashes or is
+interrupted, the next run loads the journal and only processes the
+chunks that are missing from it.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+
+class Journal:
+    """
+    Per-episode record of finished chunks, keyed by a content hash.
+
+    Args:
+        path (str): Path of the JSONL journal file
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.entries = {}
+
+        if self.path.exists():
+            data = self.path.read_bytes()
+
+            # Cut off a partial last line from a crash mid-write, so the
+            # next record starts on a line of its own
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                with open(self.path, "r+b") as f:
+                    f.truncate(end)
+                data = data[:end]
+
+            for line in data.decode("utf-8").splitlines():
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.entries[entry["key"]] = entry["result"]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def record(self, key, result):
+        """
+        Durably append the result of one finished chunk.
+
+        Args:
+            key (str): Content hash identifying the chunk
+            result: JSON-serializable result for the chunk
+        """
+        line = json.dumps({"key": key, "result": result}) + "\n"
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[key] = result
+
+    def remove(self):
+        """
+        Delete the journal file once its results have been written out.
+        """
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
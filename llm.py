@@ -0,0 +1,450 @@
+"""
+Shared client for the LLM and Whisper API calls made by every pipeline stage.
+
+All requests to a model go through one Limiter, no matter which module
+or episode they come from. A limiter combines:
+- A token bucket that caps the request rate per provider or model
+- An AIMD concurrency limit: it grows by about one request per round
+  trip while calls succeed quickly, and is cut multiplicatively on 429s,
+  5xx errors and latency spikes. Latency is only compared between
+  requests of about the same size (tokens, or bytes of audio), so a mix
+  of short and long requests doesn't look like a slowdown
+- Retries with exponential backoff and full jitter, bounded by a deadline
+- Waiters let through largest job first, using the cost the work queue
+  in scheduler.py records for the job running on each thread
+
+Set LLM_METRICS=<seconds> to print live metrics (in flight, queued,
+current limit, latency, retries) at that interval.
+
+Deterministic completions (temperature=0) can be served from a
+CompletionCache: set llm.completion_cache before making requests.
+
+PromptUsage totals the prompt tokens that providers served from their
+own prefix (context) cache, and those they didn't.
+"""
+
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+import litellm
+
+from cache import CompletionCache
+
+# Thread pool size for callers; the limiters decide how many actually run
+MAX_THREADS = 64
+
+# Requests per second and burst size, by model or provider prefix
+RATE_LIMITS = {
+    "deepseek": (20, 40),
+    "fireworks_ai": (5, 10),
+    "groq": (5, 10),
+}
+DEFAULT_RATE_LIMIT = (10, 20)
+
+# Cost of the job running on each thread, set by the work queue
+current_job = threading.local()
+
+INITIAL_CONCURRENCY = 10
+MAX_CONCURRENCY = MAX_THREADS
+
+# A size class's latency above this multiple of its best is a spike
+LATENCY_SPIKE = 3
+
+# Fraction of the gap to the current latency that the best latency of a
+# size class gives up on every request, so an old best is forgotten
+BEST_LATENCY_DECAY = 0.01
+
+MAX_RETRIES = 8
+DEADLINE_SEC = 15 * 60
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+RETRYABLE_ERRORS = (
+    litellm.RateLimitError,
+    litellm.APIConnectionError,
+    litellm.Timeout,
+    litellm.InternalServerError,
+    litellm.ServiceUnavailableError,
+)
+
+
+class TokenBucket:
+    """
+    Classic token bucket: rate tokens per second, holding at most burst tokens.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token, sleeping until one is available.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Limiter:
+    """
+    Rate limit, adaptive concurrency limit and metrics for one model.
+
+    Args:
+        name (str): Model name the limiter is for
+        rate (float): Requests per second
+        burst (int): Token bucket size
+    """
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.cond = threading.Condition()
+
+        self.limit = float(INITIAL_CONCURRENCY)
+        self.in_flight = 0
+        self.waiters = []  # heap of (-priority, arrival), one per waiting caller
+        self.arrivals = itertools.count()
+        self.last_decrease = 0
+
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.latency = None  # moving average, seconds
+        self.size_classes = {}  # log2 of request size -> [average, best latency]
+
+    def acquire(self, priority=0):
+        """
+        Wait for a free concurrency slot and a rate limit token.
+
+        Slots go to the waiter with the highest priority, then to the one
+        that has waited longest.
+
+        Args:
+            priority (float): Priority of the request, e.g. its job's cost
+        """
+        with self.cond:
+            entry = (-priority, next(self.arrivals))
+            heapq.heappush(self.waiters, entry)
+            while self.in_flight >= int(self.limit) or self.waiters[0] != entry:
+                self.cond.wait()
+            heapq.heappop(self.waiters)
+            self.in_flight += 1
+            # The next waiter may fit in a slot that is still free
+            self.cond.notify_all()
+
+        self.bucket.acquire()
+
+    def release(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    def on_success(self, latency, size=None):
+        """
+        Additive increase, unless latency shows the provider is backing up.
+
+        Latency is tracked per size class (requests within a factor of two
+        in size), and a spike is only judged against the same class. Without
+        a size, only 429s and 5xx errors decrease the limit.
+
+        Args:
+            latency (float): Seconds the request took
+            size (int): Size of the request, e.g. its total tokens, if known
+        """
+        with self.cond:
+            self.requests += 1
+            self.latency = moving_average(self.latency, latency)
+
+            spike = False
+            if size:
+                stats = self.size_classes.setdefault(
+                    int(size).bit_length(), [latency, latency]
+                )
+                stats[0] = average = moving_average(stats[0], latency)
+                best = stats[1]
+                stats[1] = min(average, best + BEST_LATENCY_DECAY * (average - best))
+                spike = average > LATENCY_SPIKE * stats[1]
+
+            if spike:
+                self.decrease(0.9)
+            else:
+                self.limit = min(MAX_CONCURRENCY, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+    def on_throttle(self):
+        """
+        Multiplicative decrease on a 429 or 5xx response.
+        """
+        with self.cond:
+            self.throttled += 1
+            self.decrease(0.5)
+
+    def decrease(self, factor):
+        # Only back off once per burst of errors from the same congestion
+        now = time.monotonic()
+        if now - self.last_decrease < 1:
+            return
+        self.last_decrease = now
+        self.limit = max(1.0, self.limit * factor)
+
+    def metrics(self):
+        with self.cond:
+            return dict(
+                model=self.name,
+                in_flight=self.in_flight,
+                queued=len(self.waiters),
+                limit=int(self.limit),
+                requests=self.requests,
+                retries=self.retries,
+                throttled=self.throttled,
+                failures=self.failures,
+                latency=self.latency,
+            )
+
+
+def moving_average(average, value):
+    if average is None:
+        return value
+    return 0.8 * average + 0.2 * value
+
+
+limiters = {}
+limiters_lock = threading.Lock()
+
+
+def get_limiter(model):
+    """
+    Return the shared limiter for a model, creating it on first use.
+    """
+    with limiters_lock:
+        if model not in limiters:
+            provider = model.split("/")[0]
+            rate, burst = RATE_LIMITS.get(
+                model, RATE_LIMITS.get(provider, DEFAULT_RATE_LIMIT)
+            )
+            limiters[model] = Limiter(model, rate, burst)
+            start_reporter()
+        return limiters[model]
+
+
+def is_retryable(error):
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+
+def call(model, fn, size_of=None, deadline_sec=DEADLINE_SEC, max_retries=MAX_RETRIES):
+    """
+    Run one API request for a model under its shared limits, with retries.
+
+    Args:
+        model (str): Model name, used to pick the limiter
+        fn (callable): Makes the request; called again on each retry
+        size_of (callable): Returns the size of the request from its result,
+            so its latency is compared with requests of the same size
+        deadline_sec (float): Give up retrying after this many seconds
+        max_retries (int): Give up after this many retries
+
+    Returns:
+        Whatever fn returns
+    """
+    limiter = get_limiter(model)
+    deadline = time.monotonic() + deadline_sec
+
+    attempt = 0
+    while True:
+        limiter.acquire(getattr(current_job, "cost", 0))
+        start = time.monotonic()
+        try:
+            result = fn()
+        except Exception as error:
+            limiter.release()
+            if not is_retryable(error):
+                with limiter.cond:
+                    limiter.failures += 1
+                raise
+
+            limiter.on_throttle()
+
+            # Full jitter backoff
+            delay = random.uniform(0, min(60, 2**attempt))
+            attempt += 1
+            if attempt > max_retries or time.monotonic() + delay > deadline:
+                with limiter.cond:
+                    limiter.failures += 1
+                raise
+
+            with limiter.cond:
+                limiter.retries += 1
+            print(f"Retrying {model} in {delay:.1f}s after {type(error).__name__}")
+            time.sleep(delay)
+            continue
+
+        limiter.release()
+        size = size_of(result) if size_of else None
+        limiter.on_success(time.monotonic() - start, size)
+        return result
+
+
+# Optional CompletionCache for deterministic completions
+completion_cache = None
+
+
+def completion(model, messages, **kwargs):
+    """
+    litellm.completion through the shared client.
+
+    Requests with temperature=0 are looked up in completion_cache first,
+    if one is set, and their responses stored in it.
+
+    Raises:
+        LookupError: The cache is in replay mode and has no reply for the request
+    """
+
+    def request():
+        return litellm.completion(model=model, messages=messages, **kwargs)
+
+    cache = completion_cache
+    if cache is None or kwargs.get("temperature") != 0:
+        return call(model, request, total_tokens)
+
+    key = CompletionCache.key(model, messages, **kwargs)
+    cached = cache.get(key)
+    if cached is not None:
+        return litellm.ModelResponse(**cached)
+    if cache.replay:
+        raise LookupError(f"No cached {model} reply to replay")
+
+    response = call(model, request, total_tokens)
+    cache.put(key, model, response.model_dump())
+    return response
+
+
+def total_tokens(response):
+    """
+    Prompt plus completion tokens of a response, or None if not reported.
+    """
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage else None
+
+
+class PromptUsage:
+    """
+    Running totals of cached and uncached prompt tokens across responses.
+    """
+
+    def __init__(self):
+        self.cached = 0
+        self.uncached = 0
+        self.lock = threading.Lock()
+
+    def add(self, response):
+        """
+        Add a completion response's prompt token usage to the totals.
+        """
+        cached, uncached = prompt_tokens(response)
+        with self.lock:
+            self.cached += cached
+            self.uncached += uncached
+
+    def report(self):
+        total = self.cached + self.uncached
+        percent = 100 * self.cached / total if total else 0
+        return (
+            f"{total:,} prompt tokens, {self.cached:,} cached by the provider"
+            f" ({percent:.0f}%), {self.uncached:,} uncached"
+        )
+
+
+def prompt_tokens(response):
+    """
+    Split a response's prompt tokens into provider cache hits and misses.
+
+    DeepSeek reports prompt_cache_hit_tokens and prompt_cache_miss_tokens.
+    OpenAI-style providers report prompt_tokens_details.cached_tokens.
+
+    Returns:
+        tuple: (cached tokens, uncached tokens)
+    """
+    usage = getattr(response, "usage", None)
+    if not usage:
+        return 0, 0
+
+    hit = getattr(usage, "prompt_cache_hit_tokens", None)
+    miss = getattr(usage, "prompt_cache_miss_tokens", None)
+    if hit is not None and miss is not None:
+        return hit, miss
+
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    return cached, (getattr(usage, "prompt_tokens", None) or 0) - cached
+
+
+def transcription(model, audio_path, **kwargs):
+    """
+    litellm.transcription through the shared client.
+
+    The file is reopened for every attempt, so retries upload it from the start.
+    """
+
+    def request():
+        with open(audio_path, "rb") as audio_file:
+            return litellm.transcription(model=model, file=audio_file, **kwargs)
+
+    return call(model, request, lambda _: os.path.getsize(audio_path))
+
+
+def metrics():
+    """
+    Return live metrics for every model used so far.
+    """
+    with limiters_lock:
+        return [limiter.metrics() for limiter in limiters.values()]
+
+
+def print_metrics():
+    for m in metrics():
+        latency = f"{m['latency']:.1f}s" if m["latency"] is not None else "-"
+        print(
+            f"{m['model']}: {m['in_flight']} in flight, {m['queued']} queued,"
+            f" limit {m['limit']}, {m['requests']} done, {m['retries']} retries,"
+            f" {m['throttled']} throttled, {m['failures']} failed, latency {latency}"
+        )
+
+
+reporter = None
+
+
+def start_reporter():
+    """
+    Start printing metrics periodically, if LLM_METRICS is set.
+    """
+    global reporter
+    interval = float(os.environ.get("LLM_METRICS", 0))
+    if not interval or reporter:
+        return
+
+    def report():
+        while True:
+            time.sleep(interval)
+            print_metrics()
+
+    reporter = threading.Thread(target=report, daemon=True)
+    reporter.start()
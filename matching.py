@@ -0,0 +1,207 @@
+"""
+Locate text quoted by the LLM in a list of transcript words.
+
+A WordIndex joins the words' text into one lowercase string, once, and
+records where each word starts in it. Finding a quote is then a str.find
+over that string plus a bisect back to the word it starts at, instead of
+re-joining the rest of the transcript at every candidate word.
+
+When the LLM paraphrases a quote, WordIndex.approximate finds it with an
+inverted index of word shingles (runs of SHINGLE_SIZE normalized words).
+Each shingle the quote shares with the transcript votes for where the
+quote would start. Only the few positions with the most votes are scored, by the edit
+distance from the quote to the transcript there, limited to a band
+around the diagonal.
+"""
+
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+SHINGLE_SIZE = 2
+
+# Shingles more common than this ("and the", "you know") carry no position
+MAX_POSTINGS = 50
+
+# Number of top voted positions to score
+CANDIDATES = 5
+
+# Fraction of the quote's characters that must match
+MIN_CONFIDENCE = 0.75
+
+# Only the start of a long quote is scored; the LLM tends to trim the rest
+SCORE_CHARS = 200
+
+
+class WordIndex:
+    """
+    Lowercase text of a list of words, with the offset where each word starts.
+
+    The offsets skip leading whitespace, so they point at the first visible
+    character of each word. A word with no visible text gets the offset of
+    the next word that has some.
+
+    Args:
+        words: List of word dicts with a "text" field
+    """
+
+    def __init__(self, words):
+        self.words = words
+        pieces = [w["text"].lower() for w in words]
+        self.text = "".join(pieces)
+
+        # Ignore trailing whitespace when comparing the end of the transcript
+        self.text_end = len(self.text.rstrip())
+
+        self.stripped = [piece.strip() for piece in pieces]
+        self.shingles = None
+        self.starts = [0] * len(pieces)
+        position = len(self.text)
+        next_start = position
+        for i in reversed(range(len(pieces))):
+            piece = pieces[i]
+            position -= len(piece)
+            visible = piece.lstrip()
+            if visible:
+                next_start = position + len(piece) - len(visible)
+            self.starts[i] = next_start
+
+    def __len__(self):
+        return len(self.words)
+
+    def find(self, quote):
+        """
+        Find the first word where the transcript continues with the quote.
+
+        Like the lookup it replaces, a match must start at a word, and the
+        quote must start with that word's whole text.
+
+        Args:
+            quote: Lowercase, stripped text to look for
+
+        Returns:
+            int or None: Index of the word the quote starts at
+        """
+        position = self.text.find(quote)
+        while position != -1:
+            i = bisect_left(self.starts, position)
+            if i < len(self.starts) and self.starts[i] == position:
+                if quote.startswith(self.stripped[i]):
+                    return i
+            position = self.text.find(quote, position + 1)
+
+    def text_at(self, i, length):
+        """
+        Return up to length characters of the transcript from word i on.
+        """
+        start = self.starts[i]
+        return self.text[start : min(start + length, self.text_end)]
+
+    def approximate(self, quote, min_confidence=MIN_CONFIDENCE):
+        """
+        Find the word where the transcript best matches a paraphrased quote.
+
+        Args:
+            quote: Lowercase, stripped text to look for
+            min_confidence (float): Lowest confidence that counts as a match
+
+        Returns:
+            tuple: (word index, confidence from 0 to 1), or (None, 0.0)
+        """
+        if self.shingles is None:
+            self.build_shingles()
+
+        tokens = normalize(quote.split())
+        votes = Counter()
+        for j in range(len(tokens) - SHINGLE_SIZE + 1):
+            postings = self.shingles.get(tuple(tokens[j : j + SHINGLE_SIZE]), ())
+            if len(postings) > MAX_POSTINGS:
+                continue
+            for k in postings:
+                if k >= j:
+                    votes[k - j] += 1
+
+        # Score each candidate and its neighbours, in case the quote
+        # gained or lost a word at the start
+        candidates = set()
+        for start, _ in votes.most_common(CANDIDATES):
+            for token in (start - 1, start, start + 1):
+                if 0 <= token < len(self.token_words):
+                    candidates.add(self.token_words[token])
+
+        quote = quote[:SCORE_CHARS]
+        band = int(len(quote) * (1 - min_confidence))
+        best_index, best_dist = None, band + 1
+        for i in sorted(candidates):
+            # Only a closer match than the best so far matters
+            text = self.text_at(i, len(quote) + band)
+            dist = prefix_distance(quote, text, best_dist - 1)
+            if dist < best_dist:
+                best_index, best_dist = i, dist
+
+        if best_index is None:
+            return None, 0.0
+        return best_index, 1 - best_dist / max(1, len(quote))
+
+    def build_shingles(self):
+        """
+        Index the position of every shingle of normalized words.
+        """
+        self.token_words = []
+        tokens = []
+        for i, token in enumerate(normalize(self.stripped, keep_empty=True)):
+            if token:
+                self.token_words.append(i)
+                tokens.append(token)
+
+        self.shingles = defaultdict(list)
+        for k in range(len(tokens) - SHINGLE_SIZE + 1):
+            self.shingles[tuple(tokens[k : k + SHINGLE_SIZE])].append(k)
+
+
+def normalize(words, keep_empty=False):
+    """
+    Reduce words to their letters and digits, so punctuation can't break a match.
+    """
+    tokens = [re.sub(r"\W+", "", word) for word in words]
+    if keep_empty:
+        return tokens
+    return [token for token in tokens if token]
+
+
+def prefix_distance(a, b, band):
+    """
+    Levenshtein distance from a to the closest prefix of b, if it is at most band.
+
+    Only cells within band of the diagonal are computed, so the cost is
+    O(len(a) * band) instead of O(len(a) * len(b)).
+
+    Returns:
+        int: The distance, or band + 1 if it is larger than band
+    """
+    over = band + 1
+    b = b[: len(a) + band]
+    if len(b) < len(a) - band:
+        return over
+
+    previous = [j if j <= band else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [over] * (len(b) + 1)
+        if i <= band:
+            current[0] = i
+        lo = max(1, i - band)
+        hi = min(len(b), i + band)
+        for j in range(lo, hi + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + cost,
+                over,
+            )
+        if min(current[lo - 1 : hi + 1]) > band:
+            return over
+        previous = current
+
+    # Whatever follows the closest prefix is free
+    return min(previous)
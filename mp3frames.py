@@ -0,0 +1,377 @@
+"""
+MP3 frame scanning and byte-level slicing.
+
+This module reads MPEG audio frame headers directly from the MP3 bytes,
+without decoding any audio. It is used to:
+- Build an index of frame byte offsets and their start times
+- Cut an episode into chunks on frame boundaries, as zero-copy slices
+  of a memory-mapped file
+- Convert between times and byte offsets exactly, with a frame index
+  saved next to the episode so the MP3 is only scanned once
+"""
+
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_right
+from contextlib import contextmanager
+from itertools import accumulate, chain
+from pathlib import Path
+
+# Bitrates in kbps, indexed by [version_class][layer][bitrate_index].
+# version_class is 0 for MPEG1 and 1 for MPEG2/2.5.
+BITRATES = {
+    (0, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (0, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (0, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (1, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (1, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (1, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# Sample rates in Hz, indexed by the 2-bit version field
+SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG1
+    2: [22050, 24000, 16000],  # MPEG2
+    0: [11025, 12000, 8000],  # MPEG2.5
+}
+
+# Saved frame index: magic, MP3 file size, sample rate, frame count, first offset
+INDEX_HEADER = struct.Struct("<8sQIQQ")
+INDEX_MAGIC = b"MP3FIDX1"
+
+
+def parse_header(buf, pos):
+    """
+    Parse the 4-byte MPEG audio frame header at a byte position.
+
+    Args:
+        buf (bytes-like): MP3 file content
+        pos (int): Byte position of the candidate header
+
+    Returns:
+        tuple or None: (frame_length, samples_per_frame, sample_rate, bitrate_kbps)
+            or None if there is no valid frame header at pos
+    """
+    if pos + 4 > len(buf):
+        return None
+
+    b0, b1, b2 = buf[pos], buf[pos + 1], buf[pos + 2]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 0x03
+    layer_bits = (b1 >> 1) & 0x03
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    padding = (b2 >> 1) & 0x01
+
+    if version == 1 or layer_bits == 0:
+        return None
+    if bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    layer = 4 - layer_bits  # 1, 2 or 3
+    version_class = 0 if version == 3 else 1
+    bitrate = BITRATES[(version_class, layer)][bitrate_index]
+    sample_rate = SAMPLE_RATES[version][rate_index]
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    elif layer == 2 or version_class == 0:
+        samples = 1152
+        length = 144 * bitrate * 1000 // sample_rate + padding
+    else:
+        samples = 576
+        length = 72 * bitrate * 1000 // sample_rate + padding
+
+    return length, samples, sample_rate, bitrate
+
+
+def skip_id3v2(buf):
+    """
+    Return the byte position just past a leading ID3v2 tag, or 0 if there is none.
+    """
+    if len(buf) < 10 or bytes(buf[:3]) != b"ID3":
+        return 0
+
+    size = 0
+    for b in buf[6:10]:
+        size = (size << 7) | (b & 0x7F)
+
+    footer = 10 if buf[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def is_info_frame(buf, pos, length):
+    """
+    Check whether the frame at pos is a Xing/Info/VBRI header frame.
+
+    These frames carry encoder metadata rather than audio, so they are
+    left out of the frame index.
+    """
+    frame = bytes(buf[pos : pos + min(length, 64)])
+    return b"Xing" in frame or b"Info" in frame or b"VBRI" in frame
+
+
+class FrameIndex:
+    """
+    Byte offsets and start times of every audio frame in an MP3.
+
+    Attributes:
+        offsets (array): Byte offset of each frame, plus the end offset of the
+            last frame as a final sentinel entry
+        samples (array): Cumulative sample count at the start of each frame,
+            plus the total sample count as a final sentinel entry
+        sample_rate (int): Sample rate of the audio in Hz
+    """
+
+    def __init__(self, offsets, samples, sample_rate):
+        self.offsets = offsets
+        self.samples = samples
+        self.sample_rate = sample_rate
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def duration(self):
+        """Total audio duration in seconds."""
+        return self.samples[-1] / self.sample_rate
+
+    def frame_time(self, frame):
+        """Start time in seconds of a frame number."""
+        return self.samples[frame] / self.sample_rate
+
+    def frame_at_time(self, seconds):
+        """
+        Return the number of the frame that contains a point in time.
+
+        Times past the end of the audio return len(self), the end sentinel.
+        """
+        target = seconds * self.sample_rate
+        frame = bisect_right(self.samples, target) - 1
+        return max(0, min(frame, len(self)))
+
+    def byte_at_time(self, seconds):
+        """
+        Return the byte offset of the frame that contains a point in time.
+        """
+        return self.offsets[self.frame_at_time(seconds)]
+
+    def byte_range(self, start_sec, end_sec):
+        """
+        Find the frame-aligned byte range that covers a span of time.
+
+        Args:
+            start_sec (float): Start of the span in seconds
+            end_sec (float): End of the span in seconds
+
+        Returns:
+            tuple: (start_byte, end_byte, actual_start_sec, actual_end_sec)
+                where the actual times are those of the frame boundaries
+        """
+        first = self.frame_at_time(start_sec)
+        last = self.frame_at_time(end_sec)
+        if last < len(self) and self.frame_time(last) < end_sec:
+            last += 1
+        return (
+            self.offsets[first],
+            self.offsets[last],
+            self.frame_time(first),
+            self.frame_time(last),
+        )
+
+
+def scan_frames(buf):
+    """
+    Build a FrameIndex by walking the frame headers of an MP3.
+
+    Only the 4-byte headers are read; audio data is never decoded. If the
+    frame chain is broken by junk bytes, the scan resyncs on the next
+    header that is followed by another valid header.
+
+    Args:
+        buf (bytes-like): MP3 file content, typically a memory map
+
+    Returns:
+        FrameIndex: Index of all audio frames in the file
+    """
+    offsets = array("q")
+    samples = array("q")
+    total_samples = 0
+    sample_rate = None
+
+    end = len(buf)
+    if end >= 128 and bytes(buf[end - 128 : end - 125]) == b"TAG":
+        end -= 128  # ID3v1 trailer
+
+    pos = skip_id3v2(buf)
+    first = True
+    while pos + 4 <= end:
+        header = parse_header(buf, pos)
+        if header is None or pos + header[0] > end:
+            pos = resync(buf, pos + 1, end)
+            if pos is None:
+                break
+            continue
+
+        length, frame_samples, rate, _ = header
+        if first and is_info_frame(buf, pos, length):
+            first = False
+            pos += length
+            continue
+        first = False
+
+        if sample_rate is None:
+            sample_rate = rate
+
+        offsets.append(pos)
+        samples.append(total_samples)
+        total_samples += frame_samples
+        pos += length
+
+    if sample_rate is None:
+        raise ValueError("No MPEG audio frames found")
+
+    offsets.append(offsets[-1] + parse_header(buf, offsets[-1])[0])
+    samples.append(total_samples)
+
+    return FrameIndex(offsets, samples, sample_rate)
+
+
+def resync(buf, pos, end):
+    """
+    Find the next byte position that starts two consecutive valid frames.
+
+    Returns:
+        int or None: Position of the next frame, or None if none is found
+    """
+    while pos + 4 <= end:
+        header = parse_header(buf, pos)
+        if header is not None:
+            nxt = pos + header[0]
+            if nxt >= end or parse_header(buf, nxt) is not None:
+                return pos
+        pos += 1
+
+    return None
+
+
+def save_frame_index(index, path, file_size):
+    """
+    Save a FrameIndex compactly, as zlib-compressed frame lengths.
+
+    Frame lengths and sample counts barely vary, so a few hundred
+    thousand frames compress to a few KB.
+
+    Args:
+        index (FrameIndex): Index to save
+        path: Path of the index file
+        file_size (int): Size of the indexed MP3, to detect a stale index
+    """
+    offsets, samples = index.offsets, index.samples
+    lengths = array("I", (b - a for a, b in zip(offsets, offsets[1:])))
+    counts = array("I", (b - a for a, b in zip(samples, samples[1:])))
+    if sys.byteorder == "big":
+        lengths.byteswap()
+        counts.byteswap()
+
+    header = INDEX_HEADER.pack(
+        INDEX_MAGIC, file_size, index.sample_rate, len(index), offsets[0]
+    )
+    data = zlib.compress(lengths.tobytes() + counts.tobytes())
+
+    tmp = Path(str(path) + ".tmp")
+    tmp.write_bytes(header + data)
+    os.replace(tmp, path)
+
+
+def load_frame_index(path, file_size=None):
+    """
+    Load a FrameIndex saved by save_frame_index.
+
+    Args:
+        path: Path of the index file
+        file_size (int): Expected size of the MP3, or None to skip the check
+
+    Returns:
+        FrameIndex or None: The index, or None if it is missing or stale
+    """
+    try:
+        raw = Path(path).read_bytes()
+        magic, size, sample_rate, count, first = INDEX_HEADER.unpack_from(raw)
+    except (OSError, struct.error):
+        return None
+    if magic != INDEX_MAGIC or (file_size is not None and size != file_size):
+        return None
+
+    values = array("I")
+    values.frombytes(zlib.decompress(raw[INDEX_HEADER.size :]))
+    if sys.byteorder == "big":
+        values.byteswap()
+
+    offsets = array("q", accumulate(chain([first], values[:count])))
+    samples = array("q", accumulate(chain([0], values[count:])))
+    return FrameIndex(offsets, samples, sample_rate)
+
+
+def frame_index_path(mp3_path):
+    """
+    Path of the saved frame index, next to the episode's .json metadata.
+    """
+    return Path(mp3_path).with_suffix(".frames")
+
+
+def cached_frame_index(mp3_path, buf=None):
+    """
+    Load the saved frame index of an MP3, scanning the MP3 if needed.
+
+    Args:
+        mp3_path: Path to the MP3 file
+        buf (bytes-like): The MP3 content, if it is already mapped
+
+    Returns:
+        FrameIndex: Index of all audio frames in the file
+    """
+    file_size = os.path.getsize(mp3_path)
+    index_path = frame_index_path(mp3_path)
+    index = load_frame_index(index_path, file_size)
+    if index is not None:
+        return index
+
+    if buf is None:
+        with open_mp3(mp3_path) as buf:
+            index = scan_frames(buf)
+    else:
+        index = scan_frames(buf)
+
+    save_frame_index(index, index_path, file_size)
+    return index
+
+
+@contextmanager
+def open_mp3(mp3_path):
+    """
+    Memory-map an MP3 file for zero-copy slicing.
+
+    Yields:
+        memoryview: Read-only view over the whole file
+    """
+    with open(mp3_path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            yield view
+        finally:
+            view.release()
+            try:
+                mapped.close()
+            except BufferError:
+                # Slices handed to worker threads are still alive; the map
+                # is closed when they are garbage collected.
+                pass
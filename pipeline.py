@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Segment and summarize episodes in one process, overlapping the two stages.
+
+A segment's text is final as soon as the questions on both sides of it
+are verified, long before segmentation of the whole episode is done.
+This runs segment.segment with a callback that submits each final
+segment's summary to the shared work queue right away, so summarization
+API calls run alongside the remaining verification calls. Once the
+segments are written, summarize.summarize builds the .summarized.jsonl
+from them, reusing the summaries already made by text hash.
+
+With --batch, segments are summarized several per request, which needs
+them all at once, so summarization only starts after segmentation.
+
+Outputs are the same files segment.py and summarize.py write, and the
+options of both are accepted:
+
+    ./pipeline.py data/2024-12-AMA.mp3
+"""
+
+import warnings
+
+warnings.filterwarnings("ignore", category=UserWarning)
+
+import argparse
+import sys
+from pathlib import Path
+
+import llm
+from cache import CompletionCache, print_stats
+from scheduler import run_episodes, work_queue
+from segment import ROUGH_OVERLAP_TOKENS, ROUGH_TOKENS, segment
+from summarize import summarize, summarize_one, text_hash
+
+
+def segment_and_summarize(
+    input_path,
+    segments_path,
+    segments_text_path,
+    summary_path,
+    summary_text_path,
+    batched=False,
+    **segment_kwargs,
+):
+    """
+    Segment one episode, summarizing each segment as soon as it is final.
+
+    Args:
+        input_path: Path to the .punct.jsonl transcript
+        segments_path: Path to write the .segments.jsonl output
+        segments_text_path: Path to write the .segments.txt output
+        summary_path: Path to write the .summarized.jsonl output
+        summary_text_path: Path to write the .summarized.txt output
+        batched (bool): Summarize several segments per request, after
+            segmentation is done
+        **segment_kwargs: Passed on to segment.segment
+    """
+    batch = work_queue.batch()
+    hashes = []
+
+    def on_segment(record):
+        hashes.append(text_hash(record["text"]))
+        batch.submit(summarize_one, record["text"], cost=len(record["text"].split()))
+
+    segment(
+        input_path,
+        segments_path,
+        segments_text_path,
+        on_segment=None if batched else on_segment,
+        **segment_kwargs,
+    )
+    print(f"Segments saved to {segments_path}")
+
+    summaries = dict(zip(hashes, batch.gather(tqdm=True)))
+    summarize(
+        segments_path,
+        summary_path,
+        summary_text_path,
+        batched=batched,
+        summaries=summaries,
+    )
+    print(f"Summaries saved to {summary_path}")
+
+
+def summarize_only(segments_path, summary_path, summary_text_path, batched=False):
+    """
+    Summarize an episode whose segments are already up to date.
+    """
+    summarize(segments_path, summary_path, summary_text_path, batched=batched)
+    print(f"Summaries saved to {summary_path}")
+
+
+def main():
+    """
+    Command line interface to segment and summarize episodes together.
+    """
+    parser = argparse.ArgumentParser(
+        description="Segment and summarize podcast transcripts in one pipeline"
+    )
+    parser.add_argument("files", nargs="+", help="Input files to process")
+    parser.add_argument(
+        "--force", action="store_true", help="Overwrite existing output files"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Call the LLM for every request, ignoring cached replies",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="Only use cached LLM replies, failing on any request that isn't cached",
+    )
+    parser.add_argument(
+        "--rough",
+        choices=["llm", "candidates"],
+        default="llm",
+        help="Find rough question starts by sending the LLM the whole transcript,"
+        " or by having it confirm regex candidates (see candidates.py)",
+    )
+    parser.add_argument(
+        "--rough-tokens",
+        type=int,
+        default=ROUGH_TOKENS,
+        help=f"Transcript tokens per chunk in the rough pass (default: {ROUGH_TOKENS})",
+    )
+    parser.add_argument(
+        "--overlap-tokens",
+        type=int,
+        default=ROUGH_OVERLAP_TOKENS,
+        help="Tokens of overlap between rough chunks"
+        f" (default: {ROUGH_OVERLAP_TOKENS})",
+    )
+    parser.add_argument(
+        "--layout",
+        choices=["span", "prefix"],
+        default="span",
+        help="Send each verification request just its span, or the whole"
+        " transcript as a shared prefix the provider can cache",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Summarize several segments per request, after segmentation is done",
+    )
+    args = parser.parse_args()
+
+    if args.replay or not args.no_cache:
+        llm.completion_cache = CompletionCache(replay=args.replay)
+
+    episodes = []
+    summarize_episodes = []
+    for input_file in args.files:
+        base_path = Path(input_file).with_suffix("")
+        input_path = base_path.with_suffix(".punct.jsonl")
+        segments_path = base_path.with_suffix(".segments.jsonl")
+        segments_text_path = base_path.with_suffix(".segments.txt")
+        summary_path = base_path.with_suffix(".summarized.jsonl")
+        summary_text_path = base_path.with_suffix(".summarized.txt")
+
+        if summary_path.exists() and not args.force:
+            print(f"Skipping {input_path} - output already exists at {summary_path}")
+            print("Use --force to overwrite existing files")
+            continue
+
+        if segments_path.exists() and not args.force:
+            summarize_episodes.append((segments_path, summary_path, summary_text_path))
+            continue
+
+        if not input_path.exists():
+            print(f"Error: File {input_path} not found")
+            continue
+
+        episodes.append(
+            (
+                input_path,
+                segments_path,
+                segments_text_path,
+                summary_path,
+                summary_text_path,
+            )
+        )
+
+    failed = run_episodes(
+        segment_and_summarize,
+        episodes,
+        batched=args.batch,
+        rough_tokens=args.rough_tokens,
+        overlap_tokens=args.overlap_tokens,
+        layout=args.layout,
+        rough=args.rough,
+    )
+    failed += run_episodes(summarize_only, summarize_episodes, batched=args.batch)
+
+    llm.print_metrics()
+    if llm.completion_cache:
+        print_stats(llm.completion_cache.stats())
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,12 +10,16 @@ proper text formatting.
 
 The main functions:
 - align_transcription: Aligns transcription chunks and handles overlapping sections of audio transcription
+- align_chunk: Attaches the exact text span to each word of a chunk
+- merge_overlaps: Streams the aligned chunks, dropping duplicated overlap words
 - main: CLI interface for processing multiple transcription files
 """
 
 import re
 import sys
 import textwrap
+from bisect import bisect_left, bisect_right
+from collections import deque
 from pathlib import Path
 
 import jsonlines
@@ -39,85 +43,217 @@ def align_transcription(input_file, output_file, output_text):
     - Handles cases where words span chunk boundaries
     - Merges overlapping segments using a time threshold
 
+    Chunks are streamed from input to output, so only about one chunk of
+    words is held in memory at a time. The text output is wrapped as it
+    goes too, carrying only the last, unfinished line.
+
     Args:
         input_file: Path to input JSONL file with transcription data
         output_file: Path to output JSONL file for aligned transcription
         output_text: Path to output text file for word-wrapped transcription
     """
-    overlap_threshold = 0.05  # seconds for considering words as overlapping
+    with jsonlines.open(input_file) as reader, jsonlines.open(
+        output_file, mode="w"
+    ) as writer, open(output_text, "w") as txt_writer:
+        wrapper = LineWrapper(txt_writer)
+        for obj in merge_overlaps(aligned_chunks(reader)):
+            writer.write(obj)
+            wrapper.write(obj.get("text", ""))
 
-    aligned = []
+        wrapper.close()
+
+
+def aligned_chunks(reader):
+    """
+    Group the transcription records into chunks and align each one.
+
+    Each chunk is a run of word records followed by the chunk's text record.
+
+    Args:
+        reader: Iterable of transcription JSONL records
+
+    Yields:
+        list: Aligned word dicts for each chunk
+    """
     words = []
+    for obj in reader:
+        if "word" in obj:
+            words.append(obj)
+            continue
+
+        yield align_chunk(words, obj["text"])
+        words = []
+
+
+def align_chunk(words, text):
+    """
+    Attach to each word the exact slice of the chunk text it covers.
 
-    with jsonlines.open(input_file) as reader:
-        for obj in reader:
-            if "word" in obj:
-                words.append(obj)
-                continue
+    A cursor walks forward through the text, so each word is located with
+    one str.find from the cursor and the text is never copied.
 
-            text = obj["text"]
+    Args:
+        words: Word dicts for the chunk, in order
+        text: Full text of the chunk
 
-            for wobj in words:
-                word = wobj["word"]
+    Returns:
+        list: Words that were found in the text, each with a "text" field
+            covering the word plus any punctuation and space after it
+    """
+    aligned = []
+    pos = 0
+    for wobj in words:
+        word = wobj["word"]
 
-                if not [c for c in word if c.isalnum()]:
-                    print("skipping non-alphanum:", word)
-                    continue
+        if not [c for c in word if c.isalnum()]:
+            print("skipping non-alphanum:", word)
+            continue
 
-                # Strip non-alnums from ends only
-                clean_word = word.strip("".join(c for c in word if not c.isalnum()))
-                # Try splitting with original word first
-                parts = text.split(clean_word, 1)
-                if len(parts) != 2:
-                    print(
-                        f"Warning: Could not align word '{word}' in text: {text[:100]}"
-                    )
-                    continue
+        # Strip non-alnums from ends only
+        clean_word = word.strip("".join(c for c in word if not c.isalnum()))
+        found = text.find(clean_word, pos)
+        if found == -1:
+            print(
+                f"Warning: Could not align word '{word}' in text: {text[pos:pos + 100]}"
+            )
+            continue
 
-                rest = parts[1]
-                rest = rest.lstrip(" ".join(c for c in rest if not c.isalnum()))
+        # Take the punctuation and spaces that follow the word, up to the next word
+        end = found + len(clean_word)
+        while end < len(text) and not text[end].isalnum():
+            end += 1
 
-                this = text[: len(text) - len(rest)]
-                wobj["text"] = this
+        wobj["text"] = text[pos:end]
 
-                # assert abs(len(this) - len(word)) < 10, f"{word} // {this}"
+        # assert abs(len(this) - len(word)) < 10, f"{word} // {this}"
 
-                aligned.append(wobj)
+        aligned.append(wobj)
 
-                text = rest
+        pos = end
 
-            words = []
+    return aligned
 
-    merged = []
+
+def merge_overlaps(chunks):
+    """
+    Merge aligned chunks into one word stream, dropping duplicated overlap words.
+
+    Whenever a word starts before the previous one, the stream has jumped
+    back into an overlap. The words already emitted after the midpoint of
+    the jump are dropped, as are the incoming words before it.
+
+    Words are held back only while a later overlap could still drop them:
+    no word that starts before the earliest word of the next chunk can be
+    dropped, so those are emitted as soon as that chunk arrives. This relies
+    on each chunk's earliest word starting no earlier than the previous
+    chunk's, which holds for chunks cut in order from one episode.
+
+    Args:
+        chunks: Iterable of aligned word lists, one per chunk
+
+    Yields:
+        dict: Word dicts in output order
+    """
+    chunks = (chunk for chunk in chunks if chunk)
+    upcoming = next(chunks, None)
+
+    pending = []  # words that may still be dropped, sorted by start
+    starts = []
+    words = deque()
     last_time = 0
-    aligned.reverse()
-    while aligned:
-        obj = aligned.pop()
+
+    while words or upcoming:
+        if not words:
+            # Everything before this chunk's earliest word is final
+            safe = min(w["start"] for w in upcoming)
+            cut = bisect_left(starts, safe)
+            yield from pending[:cut]
+            del pending[:cut]
+            del starts[:cut]
+
+            words.extend(upcoming)
+            upcoming = next(chunks, None)
+
+        obj = words.popleft()
 
         start = obj["start"]
         if start < last_time:
             mid = (start + last_time) / 2.0
-            merged = [m for m in merged if m["start"] <= mid]
+            cut = bisect_right(starts, mid)
+            del pending[cut:]
+            del starts[cut:]
 
-            while obj["start"] < mid and aligned:
-                obj = aligned.pop()
+            while obj["start"] < mid and (words or upcoming):
+                if not words:
+                    words.extend(upcoming)
+                    upcoming = next(chunks, None)
+                obj = words.popleft()
 
         last_time = obj["start"]
 
-        merged.append(obj)
+        pending.append(obj)
+        starts.append(obj["start"])
 
-    with jsonlines.open(input_file) as reader, jsonlines.open(
-        output_file, mode="w"
-    ) as writer, open(output_text, "w") as txt_writer:
-        full_text = ""
-        for obj in merged:
-            writer.write(obj)
-            full_text += obj.get("text", "")
+    yield from pending
+
+
+class LineWrapper:
+    """
+    Word-wrap text to a file as it arrives, like textwrap.wrap on all of it.
+
+    Text is wrapped in batches of about flush_chars, up to the last
+    whitespace, since the word after it may still grow. Every line but the
+    last is then final and is written out; the last line, its trailing
+    whitespace and the unfinished word are carried over to the next batch.
+
+    Args:
+        out: Text file to write the wrapped lines to, separated by newlines
+        width (int): Maximum line width
+        flush_chars (int): Characters to collect before wrapping them
+    """
 
-        # Write word-wrapped text to output file
-        wrapped_text = "\n".join(textwrap.wrap(full_text, width=80))
-        txt_writer.write(wrapped_text)
-        # print(wrapped_text)
+    def __init__(self, out, width=80, flush_chars=10_000):
+        self.out = out
+        self.width = width
+        self.flush_chars = flush_chars
+        self.pending = []
+        self.pending_chars = 0
+        self.started = False
+
+    def write(self, text):
+        self.pending.append(text)
+        self.pending_chars += len(text)
+        if self.pending_chars >= self.flush_chars:
+            self.flush(final=False)
+
+    def close(self):
+        self.flush(final=True)
+
+    def flush(self, final):
+        text = "".join(self.pending)
+        rest = ""
+        if not final:
+            # Hold back the last word, which may still grow
+            words = text.split()
+            cut = len(text.rstrip()) - len(words[-1]) if words else 0
+            text, rest = text[:cut], text[cut:]
+        lines = textwrap.wrap(text, width=self.width)
+
+        carry = rest
+        if not lines:
+            carry = text + rest
+        elif not final:
+            # The last line may still grow, keep it and its trailing spaces
+            carry = lines.pop() + text[len(text.rstrip()) :] + rest
+
+        for line in lines:
+            if self.started:
+                self.out.write("\n")
+            self.out.write(line)
+            self.started = True
+
+        self.pending = [carry]
+        self.pending_chars = len(carry)
 
 
 def main():
@@ -0,0 +1,245 @@
+"""
+Global work queue shared by every episode processed in one run.
+
+Each episode runs in its own thread and submits its jobs (transcription
+chunks, question spans, segments to summarize) as a Batch. All batches
+feed one priority queue served by a single pool of worker threads, which
+always picks the longest job first. While one episode waits on its last
+straggler, the pool keeps working on the other episodes. Each episode
+writes its outputs as soon as its own batch is finished. Callers that
+also do local work per episode, like decoding audio, can cap how many
+episodes run at once; the queue keeps the API pool busy with far fewer.
+
+Job costs are in transcript words (for audio, the words a chunk is
+expected to hold), so jobs from different stages compare fairly. The
+pool has more threads than the API concurrency limits allow, so each
+worker records its job's cost in llm.current_job, and the limiters let
+waiting requests through largest job first too.
+
+    batch = work_queue.batch()
+    for chunk in chunks:
+        batch.submit(transcribe_chunk, chunk, cost=expected_words)
+    results = batch.gather()  # in submission order
+
+Or handle each result as soon as its job finishes:
+
+    for i, result in batch.as_completed():
+        ...
+"""
+
+import heapq
+import itertools
+import threading
+import traceback
+from contextlib import nullcontext
+
+from tqdm import tqdm as progress_bar
+
+import llm
+
+
+class WorkQueue:
+    """
+    Priority queue of jobs, largest cost first, served by a pool of threads.
+
+    Args:
+        workers (int): Number of worker threads
+    """
+
+    def __init__(self, workers=llm.MAX_THREADS):
+        self.workers = workers
+        self.heap = []
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.threads = []
+
+    def put(self, job, cost):
+        """
+        Queue a zero-argument callable, to be run in cost order.
+        """
+        with self.cond:
+            if not self.threads:
+                self.start()
+            # The counter keeps equal-cost jobs in submission order
+            heapq.heappush(self.heap, (-cost, next(self.counter), job))
+            self.cond.notify()
+
+    def start(self):
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self.worker, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def worker(self):
+        while True:
+            with self.cond:
+                while not self.heap:
+                    self.cond.wait()
+                negative_cost, _, job = heapq.heappop(self.heap)
+            llm.current_job.cost = -negative_cost
+            job()
+
+    def batch(self):
+        return Batch(self)
+
+
+class Batch:
+    """
+    A group of jobs from one episode, whose results are gathered together.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.results = []
+        self.finished = []  # slots of the jobs that succeeded, in finishing order
+        self.pending = 0
+        self.error = None
+        self.cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.results)
+
+    def submit(self, fn, *args, cost=1, **kwargs):
+        """
+        Queue fn(*args, **kwargs) on the shared work queue.
+
+        Args:
+            fn (callable): Function to run
+            cost (float): Size of the job in transcript words; larger jobs
+                run first
+        """
+        slot = len(self.results)
+        self.results.append(None)
+        with self.cond:
+            self.pending += 1
+
+        def job():
+            result, error = None, None
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                traceback.print_exc()
+                error = e
+
+            with self.cond:
+                self.results[slot] = result
+                if error and not self.error:
+                    self.error = error
+                if not error:
+                    self.finished.append(slot)
+                self.pending -= 1
+                self.cond.notify_all()
+
+        self.queue.put(job, cost)
+
+    def gather(self, tqdm=True):
+        """
+        Wait for every job in the batch to finish.
+
+        Even if a job fails, the others are allowed to finish first, so any
+        results they record along the way are kept.
+
+        Returns:
+            list: Job results, in submission order
+
+        Raises:
+            The first exception raised by a job, if any
+        """
+        progress = progress_bar(total=len(self.results)) if tqdm else None
+
+        with self.cond:
+            done = 0
+            while True:
+                finished = len(self.results) - self.pending
+                if progress:
+                    progress.update(finished - done)
+                done = finished
+                if not self.pending:
+                    break
+                self.cond.wait()
+
+        if progress:
+            progress.close()
+
+        if self.error:
+            raise self.error
+        return list(self.results)
+
+    def as_completed(self, tqdm=True):
+        """
+        Yield each job's result as soon as it finishes.
+
+        Jobs that fail are skipped, and once every job is done the first
+        exception is raised, as with gather.
+
+        Yields:
+            tuple: (index of the job in submission order, result)
+        """
+        progress = progress_bar(total=len(self.results)) if tqdm else None
+
+        done = 0
+        while True:
+            with self.cond:
+                while done == len(self.finished) and self.pending:
+                    self.cond.wait()
+                ready = self.finished[done:]
+                pending = self.pending
+
+            for slot in ready:
+                if progress:
+                    progress.update(1)
+                yield slot, self.results[slot]
+            done += len(ready)
+
+            if not pending and done == len(self.finished):
+                break
+
+        if progress:
+            progress.close()
+
+        if self.error:
+            raise self.error
+
+
+# The one queue shared by all stages and episodes in this process
+work_queue = WorkQueue()
+
+
+def run_episodes(fn, items, max_episodes=None, **kwargs):
+    """
+    Run fn(item, **kwargs) for every episode, each in its own thread.
+
+    Args:
+        fn (callable): Processes one episode, submitting its jobs to work_queue
+        items (list): Arguments for each call to fn; tuples are unpacked
+        max_episodes (int): Most episodes to process at once, or None for
+            no limit
+        **kwargs: Passed on to every call to fn
+
+    Returns:
+        list: Items whose processing raised an exception
+    """
+    failed = []
+    lock = threading.Lock()
+    slots = threading.Semaphore(max_episodes) if max_episodes else nullcontext()
+
+    def run(item):
+        with slots:
+            try:
+                args = item if isinstance(item, tuple) else (item,)
+                fn(*args, **kwargs)
+            except Exception:
+                traceback.print_exc()
+                with lock:
+                    failed.append(item)
+
+    threads = [threading.Thread(target=run, args=(item,)) for item in items]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for item in failed:
+        print(f"Failed: {item}")
+
+    return failed
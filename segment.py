@@ -8,10 +8,24 @@ timestamps and text for each question/answer segment.
 
 The main functionality includes:
 - Finding question boundaries in transcripts using language models
+- A rough first pass over overlapping chunks packed to a token budget,
+  then a verification pass over the span of each question found
+- Optionally verifying just the head of each span, escalating to the
+  full span only when the head doesn't show exactly one question. This
+  is lossy: a question that starts past the head window is missed, so
+  it is never the default and pipeline.py doesn't offer it
+- Optionally replacing the rough pass with regex question candidates
+  (see candidates.py), which the LLM only confirms in small windows
+- Optionally laying out verification requests so they all start with
+  the same prefix (system prompt plus the whole transcript), which the
+  provider can serve from its context cache
+- Handing each segment to a callback as soon as it is final, so
+  pipeline.py can summarize it while segmentation goes on
 - Handling grouped questions as single segments
 - Producing both JSONL and text output files with segmented content
-- Parallel processing of transcript chunks for efficiency
+- Parallel processing of transcript chunks for efficiency, across all episodes
 """
+
 import warnings
 
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -19,17 +33,53 @@ warnings.filterwarnings("ignore", category=UserWarning)
 import re
 import sys
 import textwrap
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
 from pathlib import Path
 
 import jsonlines
 import litellm
-import lox
 from dotenv import load_dotenv
 
+import llm
+from cache import CompletionCache, print_stats
+from candidates import candidate_windows, find_candidates
 from dump import dump
+from matching import WordIndex
+from scheduler import run_episodes, work_queue
 
 load_dotenv()
 
+MODEL = "deepseek/deepseek-chat"
+
+# Transcript tokens per rough chunk, and the overlap between rough chunks.
+# The overlap is long enough to hold the start of any question whole.
+ROUGH_TOKENS = 12_000
+ROUGH_OVERLAP_TOKENS = 1_000
+
+# Questions found in two overlapping chunks within this many words are one
+DUPLICATE_WORDS = 25
+
+# Transcript tokens sent when verifying just the head of a span
+HEAD_TOKENS = 1_000
+
+CONTINUATION_HINT = "\n\n[The transcript continues after this point.]"
+
+# Words quoted to name the start and end of a span in the prefix layout
+SPAN_QUOTE_WORDS = 12
+
+SPAN_PROMPT = """
+Only look at the part of the transcript above that starts with:
+
+{start}
+
+and ends with:
+
+{end}
+
+Find the questions in that part only, following the instructions above.
+""".strip()
+
 SYSTEM = """
 The user will share the transcript of a podcast episode.
 It's an "Ask Me Anything" episode from Sean Carroll's Mindscape podcast.
@@ -61,15 +111,17 @@ Do not skip, re-order or summarize.
 """.strip()
 
 
-@lox.thread(10)
-def find_questions(words, start, end, rough=False):
+def find_questions(words, start, end, continues=False, transcript=None, usage=None):
     """Identify questions in a segment of transcript words.
 
     Args:
         words: List of word dicts containing text and timestamps
         start: Start index in words list
         end: End index in words list
-        rough: If True, skip questions near chunk boundaries to avoid duplicates
+        continues: If True, tell the model the transcript goes on past end
+        transcript: Full episode text to send ahead of a note naming the
+            segment, so every request shares the same prefix
+        usage: Optional llm.PromptUsage to add the request's prompt tokens to
 
     Returns:
         dict: Mapping of word indices to question text for found questions
@@ -78,17 +130,28 @@ def find_questions(words, start, end, rough=False):
     duration = words[-1]["end"] - words[0]["start"]
     dump(start, end, duration)
 
-    text = pretty(words)  # Convert word list to continuous text
-
-    model = "deepseek/deepseek-chat"
+    if transcript is not None:
+        # Everything up to the note naming the span is the same in every request
+        span = SPAN_PROMPT.format(
+            start=pretty(words[:SPAN_QUOTE_WORDS]).strip(),
+            end=pretty(words[-SPAN_QUOTE_WORDS:]).strip(),
+        )
+        text = f"{transcript}\n\n{span}"
+    else:
+        text = pretty(words)  # Convert word list to continuous text
+        if continues:
+            text += CONTINUATION_HINT
+    index = WordIndex(words)
 
     messages = [
         dict(role="system", content=SYSTEM),
         dict(role="user", content=text),
     ]
 
-    comp = litellm.completion(model=model, messages=messages, temperature=0)
+    comp = llm.completion(model=MODEL, messages=messages, temperature=0)
     res = comp.choices[0].message.content
+    if usage is not None:
+        usage.add(comp)
 
     lines = res.splitlines()
     lines = [l[:70] for l in lines]
@@ -101,23 +164,11 @@ def find_questions(words, start, end, rough=False):
         if line.startswith("- "):
             raw_question = question = line[2:].strip()
 
-            word_index = find_question_in_words(question, words)
+            word_index = find_question_in_words(question, index)
             if word_index is None:
                 unfound_questions.append(question)
                 continue
 
-            if rough:
-                # During the rough 5k chunking, don't call out questions
-                # near the rough chunk boundaries. They may get picked up twice,
-                # in both rough chunks they straddle.
-                EDGE = 50
-                if len(words) - word_index < EDGE:
-                    print("Skipping:", question[:50])
-                    continue
-                if word_index < EDGE:
-                    print("Skipping:", question[:50])
-                    continue
-
             print("Question:", question[:50])
             # print("start word_index:", word_index)
             # print(pretty(words[word_index:word_index+10]))
@@ -133,71 +184,248 @@ def find_questions(words, start, end, rough=False):
     return question_dict
 
 
-def find_question_in_words(question, words):
+def find_question_in_words(question, index):
     """Locate the starting position of a question in the words list.
 
     Uses exact matching first, then falls back to fuzzy matching if needed.
+    A fuzzy match must reach matching.MIN_CONFIDENCE.
 
     Args:
         question: The question text to search for
-        words: List of word dicts containing text and timestamps
+        index: WordIndex of the words to search
 
     Returns:
         int or None: Index of matching word or None if not found
     """
     question = question.strip().lower()
-    num_words = len(words)
 
-    # dump(question)
-    # full_text = "".join(w["text"] for w in words).strip().lower()
-    # dump(full_text)
-
-    for i in range(num_words):
-        if not question.startswith(words[i]["text"].strip().lower()):
-            continue
-        text = "".join(w["text"] for w in words[i:]).strip().lower()
-        if text.startswith(question):
-            return i
+    word_index = index.find(question)
+    if word_index is not None:
+        return word_index
 
     N = 10
-    question = question.split()
-    if len(question) <= N:
-        return
-    question = " ".join(question[:N])
+    prefix = " ".join(question.split()[:N])
+    if prefix != question:
+        word_index = index.find(prefix)
+        if word_index is not None:
+            return word_index
+
+    # Paraphrased by the LLM: take the best indexed approximate match
+    word_index, confidence = index.approximate(question)
+    if word_index is not None:
+        print(f"Approximate match ({confidence:.0%}):", question[:50])
+    return word_index
+
+
+def count_tokens(words):
+    """Approximate the tokens in each word's text.
+
+    The joined text is encoded once with litellm's tokenizer, which falls
+    back to a generic tokenizer for models it has no tokenizer for, and the
+    total is spread over the words by their length. Sums over runs of words
+    stay close to the encoded count, which is what chunk planning needs.
+
+    Args:
+        words: List of word dicts containing text
+
+    Returns:
+        list: Approximate token count per word
+    """
+    lengths = [len(w["text"]) for w in words]
+    total_chars = sum(lengths)
+    if not total_chars:
+        return [0] * len(words)
+
+    text = "".join(w["text"] for w in words)
+    total_tokens = len(litellm.encode(model=MODEL, text=text))
+
+    counts = []
+    previous = 0
+    for chars in accumulate(lengths):
+        tokens = (total_tokens * chars + total_chars // 2) // total_chars
+        counts.append(tokens - previous)
+        previous = tokens
+    return counts
 
-    for i in range(num_words):
-        if not question.startswith(words[i]["text"].strip().lower()):
-            continue
-        text = "".join(w["text"] for w in words[i:]).strip().lower()
-        if text.startswith(question):
-            return i
 
-    from Levenshtein import distance as levenshtein_distance
+def plan_rough_chunks(token_counts, max_tokens, overlap_tokens):
+    """Plan overlapping chunks of words that each fit in a token budget.
 
-    # Find position with minimum Levenshtein distance
-    min_dist = float("inf")
-    best_index = None
+    Args:
+        token_counts: Token count of each word
+        max_tokens: Maximum tokens in a chunk
+        overlap_tokens: Tokens shared by consecutive chunks
+
+    Returns:
+        list: (start, end) word index ranges, end exclusive
+    """
+    cumulative = [0]
+    for count in token_counts:
+        cumulative.append(cumulative[-1] + count)
+
+    num_words = len(token_counts)
+    chunks = []
+    start = 0
+    while start < num_words:
+        end = bisect_right(cumulative, cumulative[start] + max_tokens) - 1
+        end = min(max(end, start + 1), num_words)
+        chunks.append((start, end))
+        if end == num_words:
+            break
+
+        next_start = bisect_left(cumulative, cumulative[end] - overlap_tokens)
+        start = max(next_start, start + 1)
+
+    return chunks
+
+
+def merge_rough_questions(chunks, found_questions):
+    """Merge the questions found in overlapping rough chunks, without duplicates.
+
+    Each chunk owns the words from the middle of its overlap with the
+    previous chunk to the middle of its overlap with the next one. A
+    question found by the chunk that owns its position is always kept.
+    One found by a neighbouring chunk is only kept if the owner found
+    nothing within DUPLICATE_WORDS of it, so edge questions aren't lost.
+
+    Args:
+        chunks: (start, end) word ranges of the rough chunks
+        found_questions: Dict of word index to question, for each chunk
+
+    Returns:
+        dict: Mapping of word indices to question text
+    """
+    owned = {}
+    others = {}
+    for k, ((start, end), questions) in enumerate(zip(chunks, found_questions)):
+        own_start = (start + chunks[k - 1][1]) // 2 if k else 0
+        own_end = (chunks[k + 1][0] + end) // 2 if k + 1 < len(chunks) else end
+        for q_index, question in questions.items():
+            if own_start <= q_index < own_end:
+                owned[q_index] = question
+            else:
+                others.setdefault(q_index, question)
 
-    for i in range(num_words):
-        text = "".join(w["text"] for w in words[i:]).strip().lower()
-        text = text[: len(question)]
+    merged = dict(owned)
+    for q_index in sorted(others):
+        if all(abs(q_index - kept) > DUPLICATE_WORDS for kept in merged):
+            merged[q_index] = others[q_index]
+        else:
+            print("Duplicate in overlap:", others[q_index][:50])
 
-        dist = levenshtein_distance(question, text)
-        if dist < min_dist:
-            min_dist = dist
-            best_index = i
+    return dict(sorted(merged.items()))
 
-    if min_dist < 10:
-        return best_index
 
+def confirm_candidates(words):
+    """Rough pass from regex question candidates, confirmed by the LLM.
+
+    Instead of reading the whole transcript, the LLM only sees a small
+    window of words around each candidate.
+
+    Args:
+        words: List of word dicts containing text and timestamps
+
+    Returns:
+        dict: Mapping of word indices to question text
+    """
+    candidates = find_candidates(words)
+    windows = candidate_windows(candidates, len(words))
+    print(f"Candidate pass: {len(candidates)} candidates in {len(windows)} windows")
+
+    batch = work_queue.batch()
+    for start, end in windows:
+        batch.submit(
+            find_questions, words, start, end, continues=True, cost=end - start
+        )
+
+    found = {}
+    for questions in batch.gather(tqdm=True):
+        found.update(questions)
+
+    confirmed = {}
+    last = None
+    for q_index in sorted(found):
+        if last is not None and q_index - last <= DUPLICATE_WORDS:
+            continue
+        confirmed[q_index] = found[q_index]
+        last = q_index
+
+    return confirmed
+
+
+def verify_span(
+    words, start, end, cumulative, head_tokens=None, transcript=None, usage=None
+):
+    """Check the span from one candidate question to the next.
+
+    With head_tokens, only the head of a long span is sent at first. If
+    it shows exactly one question, that is taken as the verified start.
+    Otherwise the full span is sent, just as without head_tokens. The
+    rest of the span is never checked in the first case, so a question
+    that starts past the head window is lost.
+
+    Args:
+        words: List of word dicts containing text and timestamps
+        start: Index of the candidate question's first word
+        end: Index of the next candidate's first word
+        cumulative: Tokens in words[:i], for each i
+        head_tokens: Tokens in the head window, or None to send the full span
+        transcript: Full episode text, to use the shared prefix layout
+        usage: Optional llm.PromptUsage to add prompt tokens to
 
-def segment(input_file, output_file, text_file):
+    Returns:
+        tuple: (dict of word indices to question text, transcript tokens sent)
+    """
+    span_tokens = cumulative[end] - cumulative[start]
+    sent = 0
+    if head_tokens and span_tokens > head_tokens:
+        head_end = bisect_right(cumulative, cumulative[start] + head_tokens) - 1
+        head_end = max(head_end, start + 1)
+        found = find_questions(
+            words,
+            start,
+            head_end,
+            continues=True,
+            transcript=transcript,
+            usage=usage,
+        )
+        sent = cumulative[head_end] - cumulative[start]
+        if len(found) == 1:
+            return found, sent
+        print(f"Found {len(found)} questions in head window, checking full span")
+
+    found = find_questions(words, start, end, transcript=transcript, usage=usage)
+    return found, sent + span_tokens
+
+
+def segment(
+    input_file,
+    output_file,
+    text_file,
+    rough_tokens=ROUGH_TOKENS,
+    overlap_tokens=ROUGH_OVERLAP_TOKENS,
+    verify="full",
+    layout="span",
+    rough="llm",
+    on_segment=None,
+):
     """Main segmentation function that processes a transcript file.
 
     Args:
         input_file: Path to input JSONL file with transcript words
         output_file: Path to output JSONL file for segmented questions
         text_file: Path to output text file with human-readable segments
+        rough_tokens: Transcript tokens per chunk in the rough pass
+        overlap_tokens: Tokens of overlap between rough chunks
+        verify: "full" to verify each question's whole span, or "head" to
+            start with just its head window, which misses any question that
+            starts past it
+        layout: "span" to send each verification request just its span, or
+            "prefix" to send the whole transcript first and then name the span
+        rough: "llm" to find candidate questions by sending the LLM the whole
+            transcript in chunks, or "candidates" to confirm regex candidates
+        on_segment: Optional callback, passed each segment record as soon
+            as it is final, before the output files are written
     """
     dump(input_file)
 
@@ -212,21 +440,38 @@ def segment(input_file, output_file, text_file):
     ###
     # words = words[10_000:20_000]
 
-    merged_questions = {}
-    chunk_size = 5000
-    start_index = 0
-    while start_index < len(words):
-        end_index = min(start_index + chunk_size, len(words))
-        find_questions.scatter(words, start_index, end_index, rough=True)
-        start_index += chunk_size
+    token_counts = count_tokens(words)
+    if rough == "candidates":
+        merged_questions = confirm_candidates(words)
+    else:
+        chunks = plan_rough_chunks(token_counts, rough_tokens, overlap_tokens)
+        print(f"Rough pass: {sum(token_counts):,} tokens in {len(chunks)} chunks")
+
+        batch = work_queue.batch()
+        for start_index, end_index in chunks:
+            batch.submit(
+                find_questions,
+                words,
+                start_index,
+                end_index,
+                cost=end_index - start_index,
+            )
+
+        merged_questions = merge_rough_questions(chunks, batch.gather(tqdm=True))
 
-    for chunk_dict in find_questions.gather(tqdm=True):
-        merged_questions.update(chunk_dict)
+    cumulative = [0, *accumulate(token_counts)]
+    head_tokens = HEAD_TOKENS if verify == "head" else None
+    transcript = pretty(words) if layout == "prefix" else None
+    usage = llm.PromptUsage()
+    full_tokens = 0
+    sent_tokens = 0
 
+    emitted = set()
     final_questions = {}
     questions = merged_questions
     while questions:
         question_indexes = sorted(questions.keys())
+        batch = work_queue.batch()
         for i, q_index in enumerate(question_indexes):
             start = q_index
             if i < len(question_indexes) - 1:
@@ -234,11 +479,29 @@ def segment(input_file, output_file, text_file):
             else:
                 end = len(words)
 
-            find_questions.scatter(words, start, end)
+            full_tokens += cumulative[end] - cumulative[start]
+            batch.submit(
+                verify_span,
+                words,
+                start,
+                end,
+                cumulative,
+                head_tokens,
+                transcript,
+                usage,
+                cost=end - start,
+            )
 
-        found_questions = find_questions.gather(tqdm=True)
-        new_questions = dict()
-        for q_index, verified_dict in zip(questions, found_questions):
+        # Handle each span as it returns, so final segments are passed on
+        # while the rest of the round is still being verified
+        found_questions = [None] * len(question_indexes)
+        unfinished = 0  # first span that hasn't returned yet
+        new_start = len(words)  # first question to verify in the next round
+        for slot, (verified_dict, tokens) in batch.as_completed(tqdm=True):
+            found_questions[slot] = verified_dict
+            sent_tokens += tokens
+
+            q_index = question_indexes[slot]
             if len(verified_dict) == 1:
                 verified_index = list(verified_dict.keys())[0]
                 diff = abs(verified_index - q_index)
@@ -248,6 +511,26 @@ def segment(input_file, output_file, text_file):
                 #    dump(diff, questions[q_index])
                 #    assert False, output_file
             elif len(verified_dict) > 1:
+                new_start = min(new_start, min(verified_dict))
+
+            while (
+                unfinished < len(found_questions)
+                and found_questions[unfinished] is not None
+            ):
+                unfinished += 1
+
+            if on_segment:
+                # No question can still turn up before this word
+                frontier = new_start
+                if unfinished < len(question_indexes):
+                    frontier = min(frontier, question_indexes[unfinished])
+                emit_final_segments(
+                    words, final_questions, frontier, emitted, on_segment
+                )
+
+        new_questions = dict()
+        for verified_dict in found_questions:
+            if len(verified_dict) > 1:
                 # Multiple questions found - add them all back to be processed
                 new_questions.update(verified_dict.items())
 
@@ -255,45 +538,112 @@ def segment(input_file, output_file, text_file):
 
     final_questions = dict(sorted(final_questions.items()))
 
+    print(f"Verification ({layout} layout): {usage.report()}")
+
+    if head_tokens and transcript is None:
+        saved = full_tokens - sent_tokens
+        print(
+            f"Verification sent {sent_tokens:,} transcript tokens instead of"
+            f" {full_tokens:,}, saving {saved:,}"
+        )
+
     with jsonlines.open(output_file, mode="w") as writer, open(
         text_file, "w"
     ) as txt_writer:
-        for i, q_index in enumerate(final_questions.keys()):
-            # Find the end of this question (start of next question or end of transcript)
-            q_index_end = len(words) - 1
-            end_time = words[q_index_end]["end"]
-            if i < len(final_questions) - 1:
-                # Get next key from sorted keys list
-                next_key = sorted(final_questions.keys())[i + 1]
-                q_index_end = next_key - 1
-                end_time = words[q_index_end + 1]["start"]
-
-            segment_text = "".join(w["text"] for w in words[q_index : q_index_end + 1])
-
-            if not segment_text.strip():
+        question_indexes = list(final_questions.keys())
+        for i, q_index in enumerate(question_indexes):
+            # The question ends where the next one starts, or at the end
+            next_index = (
+                question_indexes[i + 1] if i < len(question_indexes) - 1 else None
+            )
+            record = make_segment(words, q_index, next_index, final_questions[q_index])
+            if not record:
                 continue
 
-            start_time = words[q_index]["start"]
-
-            if end_time - start_time < 1:
-                continue
-
-            writer.write(
-                {
-                    "start": start_time,
-                    "end": end_time,
-                    "text": segment_text,
-                    "question_index": q_index,
-                    "llm_found_question": final_questions[q_index],
-                }
-            )
+            writer.write(record)
 
             # Write word-wrapped text to output file
-            wrapped_text = "\n".join(textwrap.wrap(segment_text, width=80))
+            wrapped_text = "\n".join(textwrap.wrap(record["text"], width=80))
 
             txt_writer.write(f"=====\n{final_questions[q_index]}\n\n{wrapped_text}\n\n")
 
 
+def make_segment(words, q_index, next_index, question):
+    """Build the output record for the segment from one question to the next.
+
+    Args:
+        words: List of word dicts containing text and timestamps
+        q_index: Index of the question's first word
+        next_index: Index of the next question's first word, or None if last
+        question: Question text as the LLM found it
+
+    Returns:
+        dict or None: The segment, or None if it is empty or under a second long
+    """
+    # Find the end of this question (start of next question or end of transcript)
+    q_index_end = len(words) - 1
+    end_time = words[q_index_end]["end"]
+    if next_index is not None:
+        q_index_end = next_index - 1
+        end_time = words[q_index_end + 1]["start"]
+
+    segment_text = "".join(w["text"] for w in words[q_index : q_index_end + 1])
+
+    if not segment_text.strip():
+        return
+
+    start_time = words[q_index]["start"]
+
+    if end_time - start_time < 1:
+        return
+
+    return {
+        "start": start_time,
+        "end": end_time,
+        "text": segment_text,
+        "question_index": q_index,
+        "llm_found_question": question,
+    }
+
+
+def emit_final_segments(words, final_questions, frontier, emitted, on_segment):
+    """Pass on_segment each segment that later verification can't change.
+
+    A span still being verified can only find questions after its start,
+    and so can the spans of a later round, which start at questions found
+    by this one. Below the earliest of those starts, the frontier, every
+    question is known, so each segment that ends by the frontier is final.
+
+    Args:
+        words: List of word dicts containing text and timestamps
+        final_questions: Verified questions so far, by word index
+        frontier: Word index before which no new question can be found;
+            len(words) once verification is done
+        emitted: Set of (start, end) segments already passed on; updated
+        on_segment: Called with each newly final segment record
+    """
+    question_indexes = sorted(final_questions)
+    for i, q_index in enumerate(question_indexes):
+        next_index = question_indexes[i + 1] if i < len(question_indexes) - 1 else None
+        end = next_index if next_index is not None else len(words)
+        if end > frontier:
+            break
+        if (q_index, end) in emitted:
+            continue
+
+        emitted.add((q_index, end))
+        record = make_segment(words, q_index, next_index, final_questions[q_index])
+        if record:
+            on_segment(record)
+
+
+def segment_file(input_path, output_path, text_path, **kwargs):
+    """Segment one episode and report where the outputs were saved."""
+    segment(input_path, output_path, text_path, **kwargs)
+    print(f"Saved to {output_path}")
+    print(f"Text segments saved to {text_path}")
+
+
 def pretty(merged):
     """Convert list of word objects into continuous text.
 
@@ -329,8 +679,57 @@ def main():
     parser.add_argument(
         "--force", action="store_true", help="Overwrite existing output files"
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Call the LLM for every request, ignoring cached replies",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="Only use cached LLM replies, failing on any request that isn't cached",
+    )
+    parser.add_argument(
+        "--rough",
+        choices=["llm", "candidates"],
+        default="llm",
+        help="Find rough question starts by sending the LLM the whole transcript,"
+        " or by having it confirm regex candidates (see candidates.py)",
+    )
+    parser.add_argument(
+        "--rough-tokens",
+        type=int,
+        default=ROUGH_TOKENS,
+        help=f"Transcript tokens per chunk in the rough pass (default: {ROUGH_TOKENS})",
+    )
+    parser.add_argument(
+        "--overlap-tokens",
+        type=int,
+        default=ROUGH_OVERLAP_TOKENS,
+        help="Tokens of overlap between rough chunks"
+        f" (default: {ROUGH_OVERLAP_TOKENS})",
+    )
+    parser.add_argument(
+        "--verify",
+        choices=["full", "head"],
+        default="full",
+        help="Verify each question by sending its full span, or just its head"
+        " window unless that shows more or less than one question (lossy:"
+        " misses questions that start past the head window)",
+    )
+    parser.add_argument(
+        "--layout",
+        choices=["span", "prefix"],
+        default="span",
+        help="Send each verification request just its span, or the whole"
+        " transcript as a shared prefix the provider can cache",
+    )
     args = parser.parse_args()
 
+    if args.replay or not args.no_cache:
+        llm.completion_cache = CompletionCache(replay=args.replay)
+
+    episodes = []
     for input_file in args.files:
         base_path = Path(input_file).with_suffix("")
         input_path = base_path.with_suffix(".punct.jsonl")
@@ -346,9 +745,25 @@ def main():
             print("Use --force to overwrite existing files")
             continue
 
-        segment(input_path, output_path, text_path)
-        print(f"Saved to {output_path}")
-        print(f"Text segments saved to {text_path}")
+        episodes.append((input_path, output_path, text_path))
+
+    # Segment all the episodes at once, sharing one queue of LLM calls
+    failed = run_episodes(
+        segment_file,
+        episodes,
+        rough_tokens=args.rough_tokens,
+        overlap_tokens=args.overlap_tokens,
+        verify=args.verify,
+        layout=args.layout,
+        rough=args.rough,
+    )
+
+    llm.print_metrics()
+    if llm.completion_cache:
+        print_stats(llm.completion_cache.stats())
+
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
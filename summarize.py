@@ -5,29 +5,50 @@ Mindscape podcast. It processes JSONL files containing question/answer segments,
 summaries using AI models, and outputs both JSONL and text files with the summarized content.
 
 Key Features:
-- Processes multiple input files in parallel using threading
+- Processes multiple input files in parallel, sharing one queue of LLM calls
+- Optionally packs several segments into each request and asks for JSON
+  summaries keyed by segment id, re-asking only for missing or long ones
+- Reuses the summaries in the previous output for segments whose text
+  hasn't changed, so a resegmentation only pays for what moved
 - Uses AI models to generate concise summaries of questions and answers
 - Maintains original JSONL structure while replacing full text with summaries
 - Produces both structured (JSONL) and plain text output formats
 """
+
 import warnings
 
 warnings.filterwarnings("ignore", category=UserWarning)
 
 import argparse
+import hashlib
+import json
 import re
 import sys
 from pathlib import Path
 
 import jsonlines
 import litellm
-import lox
 from dotenv import load_dotenv
 
+import llm
+from cache import CompletionCache, print_stats
 from dump import dump
+from scheduler import run_episodes, work_queue
 
 load_dotenv()
 
+MODEL = "deepseek/deepseek-chat"  # AI model to use for summarization
+MAX_WORDS = 50  # Target maximum words for the summary
+
+# Replies longer than this many times MAX_WORDS are asked to be shortened
+TOO_LONG = 1.5
+
+# Limits for packing segments into one batched request
+BATCH_TOKENS = 20_000
+BATCH_SEGMENTS = 20
+
+# Batched requests made for the segments still missing a good summary
+BATCH_ROUNDS = 3
 
 SYSTEM = """
 The user will share a transcript from a podcast episode.
@@ -47,8 +68,34 @@ BE VERY CONCISE, AT MOST {max_words} TOTAL!
 TWO **SHORT** SENTENCES!
 """.strip()
 
+BATCH_SYSTEM = """
+The user will share several transcript segments from a podcast episode.
+It's from an "Ask Me Anything" episode from Sean Carroll's Mindscape podcast.
+He reads a series of questions from listeners and then answers them.
+Each segment starts with a line like "=== Segment 3 ===".
+
+For EACH segment, write 2 concise sentences: a summary of the question and a summary of Sean's answer.
+
+Start the first sentence with "<NAME> ...".
+
+Or start it with "<NAME1>, <NAME2> and <NAME3> ..." if the segment has a set of questions from multiple users (Sean sometimes groups related questions together). Only provide a single concise sentence that summarizes the question topic that has been grouped.
+
+Start the second sentence with "Sean ..."
+
+Reply with a JSON object with one entry per segment, like this:
+
+{{"summaries": [{{"id": 3, "summary": "Raul asks ... Sean ..."}}, {{"id": 4, "summary": "..."}}]}}
+
+BE VERY CONCISE, AT MOST {max_words} WORDS PER SUMMARY!
+TWO **SHORT** SENTENCES EACH!
+""".strip()
+
+BATCH_TOO_LONG = """
+Last time these summaries came out too long.
+Keep every summary under {max_words} words!
+""".strip()
+
 
-@lox.thread(25)
 def summarize_one(text):
     """
     Generate a concise summary of a single podcast question/answer segment using AI.
@@ -61,9 +108,8 @@ def summarize_one(text):
              - A concise summary of the question(s)
              - A concise summary of Sean's answer
     """
-    model = "deepseek/deepseek-chat"  # AI model to use for summarization
-
-    max_words = 50  # Target maximum words for the summary
+    model = MODEL
+    max_words = MAX_WORDS
 
     messages = [
         dict(role="system", content=SYSTEM.format(max_words=max_words)),
@@ -74,12 +120,12 @@ def summarize_one(text):
     # print()
     # dump(text)
 
-    comp = litellm.completion(model=model, messages=messages, temperature=0)
+    comp = llm.completion(model=model, messages=messages, temperature=0)
     reply = comp.choices[0].message.content
 
     num_words = len(reply.split())
     rounds = 0
-    while num_words > max_words * 1.5 and rounds <= 3:
+    while num_words > max_words * TOO_LONG and rounds <= 3:
         messages += [
             dict(role="assistant", content=reply),
             dict(
@@ -87,7 +133,7 @@ def summarize_one(text):
                 content=f"That is too long! Make it less than {max_words} words!",
             ),
         ]
-        comp = litellm.completion(model=model, messages=messages, temperature=0)
+        comp = llm.completion(model=model, messages=messages, temperature=0)
         reply = comp.choices[0].message.content
         rounds += 1
 
@@ -97,7 +143,174 @@ def summarize_one(text):
     return reply
 
 
-def summarize(input_file, output_file, text_file):
+def plan_batches(
+    ids, token_counts, max_tokens=BATCH_TOKENS, max_segments=BATCH_SEGMENTS
+):
+    """
+    Pack segments into batched requests, in order, under the batch limits.
+
+    Args:
+        ids (list): Segment ids to pack
+        token_counts (list): Token count of every segment's text, by id
+
+    Returns:
+        list: Lists of segment ids, one per request
+    """
+    batches = []
+    tokens = 0
+    for i in ids:
+        if (
+            not batches
+            or len(batches[-1]) >= max_segments
+            or tokens + token_counts[i] > max_tokens
+        ):
+            batches.append([])
+            tokens = 0
+        batches[-1].append(i)
+        tokens += token_counts[i]
+
+    return batches
+
+
+def summarize_batch(texts, ids, too_long=False):
+    """
+    Summarize several segments in one request, with a JSON reply.
+
+    Args:
+        texts (list): Text of every segment, by id
+        ids (list): Ids of the segments to summarize
+        too_long (bool): Warn that the previous summaries were too long
+
+    Returns:
+        dict: Summary by segment id, for each id the reply included
+    """
+    system = BATCH_SYSTEM.format(max_words=MAX_WORDS)
+    if too_long:
+        system += "\n\n" + BATCH_TOO_LONG.format(max_words=MAX_WORDS)
+
+    content = "\n\n".join(f"=== Segment {i} ===\n{texts[i]}" for i in ids)
+    messages = [
+        dict(role="system", content=system),
+        dict(role="user", content=content),
+    ]
+
+    comp = llm.completion(
+        model=MODEL,
+        messages=messages,
+        temperature=0,
+        response_format={"type": "json_object"},
+    )
+    reply = comp.choices[0].message.content
+
+    try:
+        entries = json.loads(reply)["summaries"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        print(f"Could not parse batched summaries: {reply[:100]}")
+        return {}
+
+    summaries = {}
+    for entry in entries:
+        try:
+            i = int(entry["id"])
+            summary = entry["summary"].strip()
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+        if i in ids and summary:
+            summaries[i] = summary
+
+    return summaries
+
+
+def summarize_batched(texts):
+    """
+    Summarize segments in batched requests, re-asking only for the offenders.
+
+    Each round packs the segments still without a good summary into
+    requests. A summary is good once it is within TOO_LONG times MAX_WORDS.
+    After BATCH_ROUNDS, a segment that never got any summary is summarized
+    on its own, and one whose summaries were all too long keeps the last.
+
+    Args:
+        texts (list): Text of each segment
+
+    Returns:
+        list: Summary of each segment
+    """
+    token_counts = [len(litellm.encode(model=MODEL, text=text)) for text in texts]
+
+    summaries = [None] * len(texts)
+    pending = list(range(len(texts)))
+    requests = 0
+    for round_num in range(BATCH_ROUNDS):
+        if round_num:
+            print(f"Re-asking for {len(pending)} missing or long summaries")
+        batches = plan_batches(pending, token_counts)
+        requests += len(batches)
+
+        batch = work_queue.batch()
+        for ids in batches:
+            cost = sum(len(texts[i].split()) for i in ids)
+            batch.submit(summarize_batch, texts, ids, round_num > 0, cost=cost)
+
+        for replies in batch.gather(tqdm=True):
+            for i, summary in replies.items():
+                summaries[i] = summary
+
+        pending = [
+            i
+            for i in pending
+            if summaries[i] is None or len(summaries[i].split()) > MAX_WORDS * TOO_LONG
+        ]
+        if not pending:
+            break
+
+    missing = [i for i in range(len(texts)) if summaries[i] is None]
+    if missing:
+        batch = work_queue.batch()
+        for i in missing:
+            batch.submit(summarize_one, texts[i], cost=len(texts[i].split()))
+        for i, summary in zip(missing, batch.gather(tqdm=True)):
+            summaries[i] = summary
+        requests += len(missing)
+
+    print(f"Summarized {len(texts)} segments in {requests} requests")
+    return summaries
+
+
+def text_hash(text):
+    """
+    Hash a segment's text together with everything else that shapes its summary.
+    """
+    key = json.dumps([MODEL, SYSTEM.format(max_words=MAX_WORDS), text])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def hashes_path(output_file):
+    """
+    Path of the side file that keeps each summary by the hash of its text.
+
+    The hashes are kept out of the .summarized.jsonl records, since those
+    are copied into the published fingerprint and sync outputs.
+    """
+    return Path(output_file).with_suffix(".hashes.json")
+
+
+def load_previous_summaries(output_file):
+    """
+    Load the summaries from a previous run, by the hash of their segment text.
+
+    Returns:
+        dict: Summary by text hash; empty if there is no previous output
+    """
+    path = hashes_path(output_file)
+    if not path.exists():
+        return {}
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def summarize(input_file, output_file, text_file, batched=False, summaries=None):
     """
     Process a JSONL file of podcast segments, generate summaries, and save results.
 
@@ -105,10 +318,13 @@ def summarize(input_file, output_file, text_file):
         input_file (str): Path to input JSONL file containing full segments
         output_file (str): Path to save summarized JSONL output
         text_file (str): Path to save plain text version of summaries
+        batched (bool): Summarize several segments per request
+        summaries (dict): Summaries already made, by text hash, to reuse
 
     The function:
     1. Reads the input JSONL file containing question/answer segments
-    2. Generates concise summaries for each segment in parallel
+    2. Generates concise summaries in parallel for each segment whose text
+       changed since the previous output, reusing the rest
     3. Saves the summarized segments in JSONL format
     4. Creates a plain text version of all summaries
     """
@@ -117,13 +333,34 @@ def summarize(input_file, output_file, text_file):
     with jsonlines.open(input_file) as reader:
         segments = list(reader)
 
-    print(f"Summarizing {len(segments)} segments...")
-
-    # Process each segment
-    for segment in segments:
-        summary = summarize_one.scatter(segment["text"])
+    previous = load_previous_summaries(output_file)
+    previous.update(summaries or {})
+    hashes = [text_hash(segment["text"]) for segment in segments]
+    changed = [i for i, h in enumerate(hashes) if h not in previous]
+    reused = len(segments) - len(changed)
+    if segments:
+        print(
+            f"Reusing {reused} of {len(segments)} summaries"
+            f" ({100 * reused / len(segments):.0f}%)"
+        )
+
+    print(f"Summarizing {len(changed)} segments...")
+
+    texts = [segments[i]["text"] for i in changed]
+    if batched:
+        new_summaries = summarize_batched(texts)
+    else:
+        # Process each segment, longest first on the shared work queue
+        batch = work_queue.batch()
+        for text in texts:
+            batch.submit(summarize_one, text, cost=len(text.split()))
+
+        new_summaries = batch.gather(tqdm=True)
+
+    summaries = [previous.get(h) for h in hashes]
+    for i, summary in zip(changed, new_summaries):
+        summaries[i] = summary
 
-    summaries = summarize_one.gather(tqdm=True)
     for segment, summary in zip(segments, summaries):
         segment["text"] = summary
 
@@ -131,12 +368,25 @@ def summarize(input_file, output_file, text_file):
     with jsonlines.open(output_file, mode="w") as writer:
         writer.write_all(segments)
 
+    # Save the summaries by text hash, for the next run to reuse
+    with open(hashes_path(output_file), "w") as f:
+        json.dump(dict(zip(hashes, summaries)), f, indent=2)
+
     # Save text summaries
     with open(text_file, "w") as f:
         for summary in summaries:
             f.write(summary + "\n\n")
 
 
+def summarize_file(input_path, output_path, text_path, **kwargs):
+    """
+    Summarize one episode and report where the outputs were saved.
+    """
+    summarize(input_path, output_path, text_path, **kwargs)
+    print(f"Saved to {output_path}")
+    print(f"Text segments saved to {text_path}")
+
+
 def main():
     """
     Command-line interface for summarizing podcast question/answer segments.
@@ -152,8 +402,27 @@ def main():
     parser.add_argument(
         "--force", action="store_true", help="Overwrite existing output files"
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Call the LLM for every request, ignoring cached replies",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="Only use cached LLM replies, failing on any request that isn't cached",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Summarize several segments per request, with JSON replies",
+    )
     args = parser.parse_args()
 
+    if args.replay or not args.no_cache:
+        llm.completion_cache = CompletionCache(replay=args.replay)
+
+    episodes = []
     for input_file in args.files:
         base_path = Path(input_file).with_suffix("")
         input_path = base_path.with_suffix(".segments.jsonl")
@@ -169,9 +438,17 @@ def main():
             print("Use --force to overwrite existing files")
             continue
 
-        summarize(input_path, output_path, text_path)
-        print(f"Saved to {output_path}")
-        print(f"Text segments saved to {text_path}")
+        episodes.append((input_path, output_path, text_path))
+
+    # Summarize all the episodes at once, sharing one queue of LLM calls
+    failed = run_episodes(summarize_file, episodes, batched=args.batch)
+
+    llm.print_metrics()
+    if llm.completion_cache:
+        print_stats(llm.completion_cache.stats())
+
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -12,6 +12,10 @@ This script synchronizes audio segment timestamps with updated MP3 files by:
 The tool is particularly useful when the source audio file is updated but the
 content structure remains similar, allowing for automatic realignment of
 previously identified segments.
+
+The new file is streamed once, front to back, and every segment's
+fingerprint is matched along the way, so an episode never costs more
+than one download of the file.
 """
 
 import argparse
@@ -21,17 +25,34 @@ import re
 import shutil
 import sys
 import time
+from bisect import bisect_left
 from datetime import datetime, timedelta
 from io import BytesIO
 from pathlib import Path
 
 import lox
+import numpy as np
 import requests
 from mutagen.mp3 import MP3
 
 from dump import dump  # Debugging utility for printing values
 from fingerprint import get_fingerprint
 
+# Size of each read while streaming the new file
+STREAM_CHUNK_BYTES = 1024 * 1024
+
+# After a missed probe, the search around the predicted position starts
+# with reads this size and doubles them on each side
+SEARCH_WINDOW_BYTES = 64 * 1024
+
+# Most bytes to fetch looking for one segment, and for a whole episode
+SEGMENT_BUDGET_BYTES = 8 * 1024 * 1024
+EPISODE_BUDGET_BYTES = 32 * 1024 * 1024
+
+# Fingerprints are spotted by their last KEY_BYTES bytes, and those keys are
+# prefiltered on their first two bytes with a 64K-entry lookup table
+KEY_BYTES = 8
+
 
 def get_file_size(url):
     """
@@ -82,6 +103,324 @@ def get_byte_range(url, start, length):
     return response.content
 
 
+def stream_bytes(url, start=0, chunk_size=STREAM_CHUNK_BYTES):
+    """
+    Stream a remote file front to back with a single request.
+
+    Args:
+        url (str): The URL of the file
+        start (int): Byte position to start streaming from
+        chunk_size (int): Number of bytes to read at a time
+
+    Yields:
+        bytes: Consecutive chunks of the file
+    """
+    headers = {"Range": f"bytes={start}-"} if start else {}
+    with requests.get(url, headers=headers, stream=True) as response:
+        response.raise_for_status()
+        yield from response.iter_content(chunk_size=chunk_size)
+
+
+class RemoteFile:
+    """
+    A remote file read with range requests, counting the bytes fetched.
+
+    Args:
+        url (str): The URL of the file
+        size (int): Size of the file in bytes
+    """
+
+    def __init__(self, url, size):
+        self.url = url
+        self.size = size
+        self.fetched = 0
+        self.requests = 0
+
+    def read(self, start, length):
+        """
+        Fetch length bytes from start, or fewer at the end of the file.
+        """
+        self.requests += 1
+        data = get_byte_range(self.url, start, length)
+        self.fetched += len(data)
+        return data
+
+    def stream(self, start=0, chunk_size=STREAM_CHUNK_BYTES):
+        """
+        Stream the file from start; stop reading to stop the download.
+        """
+        self.requests += 1
+        for chunk in stream_bytes(self.url, start, chunk_size):
+            self.fetched += len(chunk)
+            yield chunk
+
+
+def find_fingerprints(chunks, targets):
+    """
+    Find every fingerprint in one pass over a stream of bytes.
+
+    Segments keep their order in the new file, so of all the matches, the
+    longest run that is in segment order and byte order is kept. A stray
+    copy of one fingerprint can't knock out the segments around it. The
+    stream stops being read once every fingerprint has been matched.
+
+    Each chunk is viewed as overlapping 8-byte words, one per byte position,
+    so candidate positions are picked out with numpy and only those are
+    compared in Python.
+
+    Args:
+        chunks (iterable): Consecutive chunks of the file, as bytes
+        targets (list): Fingerprint bytes of each segment, in order
+
+    Returns:
+        list: Byte position of each fingerprint relative to the start of
+            the stream, or None if it wasn't found
+    """
+    positions = [None] * len(targets)
+
+    # Keys are read as little-endian words, so the low 16 bits are the
+    # first two bytes of the key
+    keys = {}
+    for n, target in enumerate(targets):
+        if len(target) >= KEY_BYTES:
+            key = int.from_bytes(target[-KEY_BYTES:], "little")
+            keys.setdefault(key, []).append(n)
+    if not keys:
+        return positions
+
+    prefilter = np.zeros(1 << 16, dtype=bool)
+    prefilter[[key & 0xFFFF for key in keys]] = True
+
+    # Keep enough of the previous chunk to match across the boundary
+    keep = max(len(target) for target in targets) - 1
+    matches = []  # (position, segment number), in stream order
+    unmatched = set(range(len(targets)))
+    buf = b""
+    buf_start = 0
+    for chunk in chunks:
+        tail = buf[len(buf) - keep :] if len(buf) > keep else buf
+        buf_start += len(buf) - len(tail)
+        buf = tail + chunk
+        if len(buf) < KEY_BYTES:
+            continue
+
+        words = np.ndarray(
+            (len(buf) - KEY_BYTES + 1,), dtype="<u8", buffer=buf, strides=(1,)
+        )
+        for i in np.flatnonzero(prefilter[words & 0xFFFF]):
+            for n in keys.get(int(words[i]), ()):
+                target = targets[n]
+                start = int(i) + KEY_BYTES - len(target)
+                # Matches inside the kept tail were found with the last chunk
+                if start < 0 or start + len(target) <= len(tail):
+                    continue
+                if buf[start : start + len(target)] == target:
+                    matches.append((buf_start + start, n))
+                    unmatched.discard(n)
+
+        if not unmatched:
+            break
+
+    for position, n in ordered_matches(matches):
+        positions[n] = position
+    return positions
+
+
+def probe_fingerprints(
+    remote,
+    targets,
+    orig_offsets,
+    segment_budget=SEGMENT_BUDGET_BYTES,
+    episode_budget=EPISODE_BUDGET_BYTES,
+):
+    """
+    Find fingerprints by probing where an ad offset model predicts them.
+
+    Dynamic ad insertion shifts the episode's audio by an offset that only
+    changes at ad breaks. Each segment is first probed at its original
+    offset plus the current delta, fetching just its fingerprint's bytes.
+    When a probe matches, a binary search over the later segments finds
+    the last one that looks to be still at that delta. A delta can change
+    and then change back, so the segments in between are then probed too,
+    middle first, and the run ends at the first one that misses. Only
+    segments whose own bytes matched are ever placed. When a probe misses,
+    search_around looks outward from the predicted position, and a match
+    gives the new delta.
+
+    The search for one segment stops at segment_budget bytes, and once the
+    episode has fetched episode_budget bytes, missed probes are not
+    searched at all. Either way the segment is reported as not found.
+
+    Args:
+        remote (RemoteFile): The new file
+        targets (list): Fingerprint bytes of each segment, in order
+        orig_offsets (list): Byte offset of each fingerprint in the original
+        segment_budget (int): Most bytes to fetch searching for one segment
+        episode_budget (int): Most bytes to fetch for the whole episode
+
+    Returns:
+        tuple: (positions, fetched) where positions has the byte position of
+            each fingerprint, or None if it wasn't found, and fetched has
+            the bytes fetched for each segment
+    """
+    count = len(targets)
+    positions = [None] * count
+    fetched = [0] * count
+    delta = 0
+    low = 0  # the next segment can't start before this
+
+    probed = {}  # (segment, delta) -> whether it matched
+
+    def probe(n):
+        position = orig_offsets[n] + delta
+        if position < low or position + len(targets[n]) > remote.size:
+            return False
+        if (n, delta) in probed:
+            return probed[n, delta]
+        before = remote.fetched
+        data = remote.read(position, len(targets[n]))
+        fetched[n] += remote.fetched - before
+        probed[n, delta] = data == targets[n]
+        return probed[n, delta]
+
+    def first_miss(start, end):
+        # First segment after start that isn't at the delta, or end if
+        # none before it is. Start has matched.
+        if end - start <= 1:
+            return end
+        mid = (start + end) // 2
+        if not probe(mid):
+            return first_miss(start, mid)
+        miss = first_miss(start, mid)
+        return miss if miss < mid else first_miss(mid, end)
+
+    n = 0
+    while n < count:
+        if probe(n):
+            good, bad = n, count
+            while bad - good > 1:
+                mid = (good + bad) // 2
+                if probe(mid):
+                    good = mid
+                else:
+                    bad = mid
+
+            miss = first_miss(n, good)
+            last = good if miss == good else miss - 1
+            for k in range(n, last + 1):
+                positions[k] = orig_offsets[k] + delta
+            low = positions[last] + 1
+            n = last + 1
+            continue
+
+        # The delta changed before segment n, so search around where it was expected
+        budget = min(segment_budget, episode_budget - remote.fetched)
+        if budget <= 0:
+            print(f"Segment {n + 1} not found: episode budget used up")
+            n += 1
+            continue
+
+        before = remote.fetched
+        position = search_around(
+            remote, targets[n], orig_offsets[n] + delta, low, budget
+        )
+        fetched[n] += remote.fetched - before
+        if position is None:
+            print(f"Segment {n + 1} not found within {budget:,} bytes")
+            n += 1
+            continue
+
+        positions[n] = position
+        delta = position - orig_offsets[n]
+        low = position + 1
+        n += 1
+
+    return positions, fetched
+
+
+def search_around(remote, target, predicted, low, budget):
+    """
+    Search outward in both directions from a predicted position.
+
+    Reads alternate between after and before the bytes already searched,
+    starting at SEARCH_WINDOW_BYTES and doubling on each side, so an ad
+    break that grew or shrank is found with about as many bytes as it
+    changed by.
+
+    Args:
+        remote (RemoteFile): The file to search
+        target (bytes): Bytes to find
+        predicted (int): Where the target is expected to start
+        low (int): The target can't start before this
+        budget (int): Most bytes to fetch
+
+    Returns:
+        int or None: Byte position of the target, or None if it wasn't found
+    """
+    overlap = len(target) - 1
+    predicted = min(max(predicted, low), remote.size)
+    ahead = behind = predicted  # [behind, ahead) has been searched
+    window = SEARCH_WINDOW_BYTES
+    spent = 0
+    while spent < budget and (ahead < remote.size or behind > low):
+        if ahead < remote.size:
+            length = min(window, budget - spent) + overlap
+            data = remote.read(ahead, length)
+            spent += len(data)
+            found = data.find(target)
+            if found != -1:
+                return ahead + found
+            if len(data) < length:
+                ahead = remote.size
+            else:
+                ahead += len(data) - overlap
+
+        if behind > low and spent < budget:
+            start = max(low, behind - min(window, budget - spent))
+            data = remote.read(start, behind - start + overlap)
+            spent += len(data)
+            found = data.find(target)
+            if found != -1:
+                return start + found
+            behind = start
+
+        window *= 2
+
+    return None
+
+
+def ordered_matches(matches):
+    """
+    Pick the longest run of matches that is in both byte and segment order.
+
+    Args:
+        matches (list): (position, segment number) pairs, sorted by position
+
+    Returns:
+        list: The chosen (position, segment number) pairs
+    """
+    # Longest strictly increasing run of segment numbers, by patience sorting
+    tails = []  # segment number ending the best run of each length
+    tail_match = []  # index in matches of that run's last match
+    previous = [None] * len(matches)
+    for m, (_, n) in enumerate(matches):
+        length = bisect_left(tails, n)
+        if length == len(tails):
+            tails.append(n)
+            tail_match.append(m)
+        else:
+            tails[length] = n
+            tail_match[length] = m
+        previous[m] = tail_match[length - 1] if length else None
+
+    chosen = []
+    m = tail_match[-1] if tail_match else None
+    while m is not None:
+        chosen.append(matches[m])
+        m = previous[m]
+    return chosen[::-1]
+
+
 def get_duration(url, bytes_per_sec):
     """
     Calculate audio duration based on file size and encoding rate.
@@ -219,29 +558,61 @@ def main():
         action="store_true",
         help="Process files in parallel using multiple threads",
     )
+    parser.add_argument(
+        "--search",
+        choices=["probe", "scan"],
+        default="probe",
+        help="Find segments by probing predicted offsets, scanning only on a miss"
+        " (default), or by scanning the whole new file",
+    )
+    parser.add_argument(
+        "--segment-budget",
+        type=float,
+        default=SEGMENT_BUDGET_BYTES / 2**20,
+        help="MB to fetch searching for one segment after a missed probe"
+        " (default: %(default)g)",
+    )
+    parser.add_argument(
+        "--episode-budget",
+        type=float,
+        default=EPISODE_BUDGET_BYTES / 2**20,
+        help="MB to fetch per episode in probe mode (default: %(default)g)",
+    )
     args = parser.parse_args()
 
+    budgets = (int(args.segment_budget * 2**20), int(args.episode_budget * 2**20))
+
     if args.parallel:
         for fname in args.files:
             print(f"\nQueuing {fname} for parallel processing...")
-            process.scatter(fname, args.force)
+            process.scatter(fname, args.force, args.search, *budgets)
     else:
         for fname in args.files:
             print(f"\nProcessing {fname}...")
-            process(fname, args.force)
+            process(fname, args.force, args.search, *budgets)
 
     if args.parallel:
         process.gather(tqdm=True)
 
 
 @lox.thread(10)
-def process(fname, force=False):
+def process(
+    fname,
+    force=False,
+    search="probe",
+    segment_budget=SEGMENT_BUDGET_BYTES,
+    episode_budget=EPISODE_BUDGET_BYTES,
+):
     """
     Process a single file to synchronize its segments with updated audio.
 
     Args:
         fname (str): Path to the file to process
         force (bool): If True, process even if URL appears valid
+        search (str): "probe" to probe predicted offsets and scan only when
+            a probe misses, or "scan" to scan the whole new file
+        segment_budget (int): Most bytes to fetch searching for one segment
+        episode_budget (int): Most bytes to fetch for the episode in probe mode
 
     The processing workflow:
     1. Load metadata and check URL validity
@@ -348,66 +719,50 @@ def process(fname, force=False):
     print(f"Duration difference: {format_time(new_duration - orig_duration)}")
     print()
 
-    # Number of bytes to use for pattern matching
-    num_bytes = 128
-
-    # Initialize search state
-    last_match_pos = 0
-    prev_duration = 0  # Track duration of previous segment
-
-    prev_segment = None
+    segments = [
+        json.loads(line) for line in Path(segments_file).read_text().splitlines()
+    ]
+
+    # Byte offset of each fingerprint in the original file. Older
+    # fingerprints were taken at the average bytes/sec offset.
+    targets = [base64.b64decode(segment["fingerprint"]) for segment in segments]
+    orig_offsets = [
+        segment.get("offset", int(segment["start"] * orig_bytes_per_sec))
+        for segment in segments
+    ]
+
+    remote = RemoteFile(url, new_len)
+    if search == "probe":
+        positions, fetched = probe_fingerprints(
+            remote, targets, orig_offsets, segment_budget, episode_budget
+        )
+    else:
+        # Stream the new file once, matching every fingerprint along the way
+        positions = find_fingerprints(remote.stream(), targets)
+        fetched = None
+    print(f"Fetched {remote.fetched:,} bytes in {remote.requests} requests")
 
     out_segments = []
-    for line in Path(segments_file).read_text().splitlines():
-        segment = json.loads(line)
+    for n, segment in enumerate(segments):
         start_sec = segment["start"]
+        orig_offset = orig_offsets[n]
+        actual_pos = positions[n]
+        cost = f", fetched {fetched[n]:,} bytes" if fetched else ""
 
-        # Calculate byte offset in original file using metadata values
-        orig_offset = int(start_sec * orig_bytes_per_sec)
-
-        # Decode base64 fingerprint
-        target_bytes = base64.b64decode(segment["fingerprint"])
-
-        # Search for these bytes in new file starting after previous match
-        search_start = last_match_pos
-        if prev_duration > 0:
-            # Start searching a bit before where we expect the segment to be
-            expected_pos = last_match_pos + int(
-                (prev_duration - 5) * orig_bytes_per_sec
+        if actual_pos is None:
+            print(
+                f"Segment at {format_time(start_sec)} not found in {segments_file}{cost}."
             )
-            search_start = max(last_match_pos, expected_pos)
-
-        pos = search_start
-        found = False
-        chunk_size = 128 * 1024  # Size of chunks to download and search
-
-        # Search through the file in chunks
-        while pos < new_len and not found:
-            chunk = get_byte_range(url, pos, chunk_size)
-            chunk_pos = chunk.find(target_bytes)
-
-            if chunk_pos != -1:
-                found = True
-                break
-
-            # Move to next chunk, overlapping slightly to avoid missing matches
-            pos += chunk_size - num_bytes
-            chunk_size = min(chunk_size * 2, 1024 * 1024)
-            continue
-
-        if not found:
-            print(f"Segment at {format_time(start_sec)} not found in {segments_file}.")
             continue
 
-        # Found matching bytes - calculate new timing
-        actual_pos = pos + chunk_pos
-        found_sec = actual_pos / orig_bytes_per_sec
+        # The fingerprint's own audio is unchanged, so the segment moved by
+        # the duration of the bytes inserted before it. Only those bytes,
+        # whose frames we can't see, are timed at the average rate.
+        found_sec = start_sec + (actual_pos - orig_offset) / orig_bytes_per_sec
         time_delta = found_sec - start_sec
         print(
-            f"Segment at {format_time(start_sec)} found at {format_time(found_sec)} (offset {actual_pos:,}, delta {format_time(abs(time_delta))})"
+            f"Segment at {format_time(start_sec)} found at {format_time(found_sec)} (offset {actual_pos:,}, delta {format_time(abs(time_delta))}{cost})"
         )
-        found = True
-        last_match_pos = actual_pos + 1
 
         # Add new timestamp to cache
         key = f"{new_len},{segment['fingerprint']}"
@@ -427,7 +782,6 @@ def process(fname, force=False):
 
         # Store current segment to update its end time when we process the next one
         out_segments.append(segment)
-        prev_duration = duration
 
     # Save updated metadata with final URL
     with open(metadata_file, "w") as f:
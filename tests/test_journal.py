@@ -0,0 +1,27 @@
+from journal import Journal
+
+
+def test_record_after_torn_write(tmp_path):
+    path = tmp_path / "episode.journal.jsonl"
+    journal = Journal(path)
+    journal.record("a", {"text": "first"})
+
+    # A crash mid-write leaves an unterminated fragment at the end
+    with open(path, "a") as f:
+        f.write('{"key": "b", "res')
+
+    journal = Journal(path)
+    assert len(journal) == 1
+    journal.record("c", {"text": "after the crash"})
+
+    journal = Journal(path)
+    assert len(journal) == 2
+    assert journal.get("a") == {"text": "first"}
+    assert journal.get("c") == {"text": "after the crash"}
+    assert "b" not in journal
+
+
+def test_remove_missing_journal(tmp_path):
+    journal = Journal(tmp_path / "missing.journal.jsonl")
+    journal.remove()
+    journal.remove()
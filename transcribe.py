@@ -1,12 +1,12 @@
 #!/usr/bin/env python3
 
 """
-Transcription module using OpenAI Whisper API with word-level timestamps.
+Transcription module using Whisper with word-level timestamps.
 
 This module handles:
 - Large audio file processing by splitting into chunks
 - Word-level timestamp generation
-- Parallel processing of audio chunks
+- Parallel processing of audio chunks, with a hosted API or a local model
 - Output in both JSONL and text formats
 """
 
@@ -18,32 +18,122 @@ warnings.filterwarnings("ignore", category=UserWarning, module="pydantic")
 import argparse
 import json
 import os
+import subprocess
 import sys
 import tempfile
 import textwrap
+import threading
+from contextlib import ExitStack
 from pathlib import Path
 
 import jsonlines
-import litellm
-import lox
 from dotenv import load_dotenv
 from openai import OpenAI
-from pydub import AudioSegment
 
+import llm
+from backends import BACKENDS
+from cache import DiskCache, print_stats
+from chunking import MAX_CHUNK_BYTES, plan_fixed_chunks, plan_silence_chunks
 from dump import dump
+from journal import Journal
+from mp3frames import cached_frame_index, open_mp3, scan_frames
+from scheduler import run_episodes, work_queue
+from speech import speech_spans, write_speech
 
 # Load environment variables from .env file
 load_dotenv()
 
+# How chunks are encoded for upload. Whisper resamples everything to 16kHz
+# mono, so the compact profiles lose nothing it would have used.
+UPLOAD_PROFILES = {
+    # Upload the episode's own MP3 frames as-is
+    "original": None,
+    "mp3-32k": dict(
+        ext="mp3",
+        args=["-ac", "1", "-ar", "16000", "-c:a", "libmp3lame", "-b:a", "32k"],
+        bitrate=32000,
+    ),
+    "opus-24k": dict(
+        ext="ogg",
+        args=["-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", "24k"],
+        bitrate=24000,
+    ),
+}
+
+# Chunk transcriptions, keyed by the chunk audio and the model settings
+cache = DiskCache(".cache/transcriptions")
+
+# Guards the per-episode upload byte counts, updated from worker threads
+upload_lock = threading.Lock()
+
+# Typical speaking rate, to cost chunks in words like every other job
+WORDS_PER_SECOND = 2.5
+
+# Episodes transcribed at once, since each decodes its audio locally
+MAX_EPISODES = os.cpu_count() or 4
+
+
+def chunk_key(chunk, upload_profile="original", backend="fireworks"):
+    """
+    Content hash of a chunk's audio together with the transcription settings.
+    """
+    return DiskCache.key(
+        chunk,
+        upload_profile=upload_profile,
+        **BACKENDS[backend].settings(),
+    )
+
+
+def encode_chunk(audio_path, upload_profile):
+    """
+    Re-encode a chunk with an upload profile, using ffmpeg.
+
+    Args:
+        audio_path (str): Path of the chunk's MP3 file
+        upload_profile (str): Name of a profile in UPLOAD_PROFILES
 
-@lox.thread(10)
-def transcribe_audio(chunk, audio_path):
+    Returns:
+        str: Path of the file to upload
+    """
+    profile = UPLOAD_PROFILES[upload_profile]
+    if not profile:
+        return audio_path
+
+    encoded_path = str(
+        Path(audio_path).with_suffix(f".{upload_profile}.{profile['ext']}")
+    )
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", "-i", audio_path]
+        + profile["args"]
+        + [encoded_path],
+        check=True,
+    )
+    return encoded_path
+
+
+def transcribe_audio(
+    chunk,
+    audio_path,
+    use_cache=True,
+    journal=None,
+    upload_profile="original",
+    backend="fireworks",
+    upload_stats=None,
+):
     """
-    Transcribe an audio chunk using OpenAI Whisper API with word-level timestamps.
+    Transcribe an audio chunk using a Whisper backend with word-level timestamps.
+
+    Results are cached on disk by the chunk's audio content and the model
+    settings, so an unchanged chunk is never sent to the API twice.
 
     Args:
-        chunk (AudioSegment): Audio chunk to transcribe
+        chunk (bytes-like): MP3 frames of the chunk, sliced from the episode
         audio_path (str): Temporary file path to save chunk for processing
+        use_cache (bool): Whether to read and write the transcription cache
+        journal (Journal): Episode journal to record the finished chunk in
+        upload_profile (str): How to encode the chunk for upload, from UPLOAD_PROFILES
+        backend (str): Name of the transcription backend, from BACKENDS
+        upload_stats (dict): Totals of original and uploaded bytes to add to
 
     Returns:
         tuple: (list of word dicts, text segment dict)
@@ -51,105 +141,198 @@ def transcribe_audio(chunk, audio_path):
             Text segment format: {"text": str, "start": float, "end": float}
     """
 
-    print(f"Exporting chunk to {audio_path}...")
-    chunk.export(audio_path, format="mp3")
-    chunk_size_mb = os.path.getsize(audio_path) / (1024 * 1024)
-    print(f"Chunk size: {chunk_size_mb:.1f}MB")
-
-    # Open audio file
-    with open(audio_path, "rb") as audio_file:
-        response = litellm.transcription(
-            model="fireworks_ai/whisper-v3",
-            # model="groq/whisper-large-v3-turbo",
-            file=audio_file,
-            response_format="verbose_json",
-            timestamp_granularities=["word"],
-        )
+    cache_key = chunk_key(chunk, upload_profile, backend)
+    if use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print(f"Using cached transcription for {audio_path}")
+            words, text_segment = cached
+            if journal:
+                journal.record(cache_key, [words, text_segment])
+            return words, text_segment
+
+    print(f"Writing chunk to {audio_path}...")
+    with open(audio_path, "wb") as f:
+        f.write(chunk)
+    upload_path = encode_chunk(audio_path, upload_profile)
+
+    original_size = os.path.getsize(audio_path)
+    upload_size = os.path.getsize(upload_path)
+    print(
+        f"Chunk size: {upload_size/(1024*1024):.1f}MB"
+        f" ({original_size/(1024*1024):.1f}MB original)"
+    )
+    if upload_stats is not None:
+        with upload_lock:
+            upload_stats["original"] += original_size
+            upload_stats["uploaded"] += upload_size
 
-    # Extract words and full text with timestamps
-    words = []
-    for word in response.words:
-        words.append(
-            {
-                "word": word["word"],
-                "start": round(word["start"], 6),
-                "end": round(word["end"], 6),
-            }
-        )
+    words, text_segment = BACKENDS[backend].transcribe(upload_path)
 
-    # Add the full text with timestamps
-    text_segment = {
-        "text": response.text,
-        "start": round(response.words[0]["start"], 6) if response.words else 0,
-        "end": round(response.words[-1]["end"], 6)
-        if response.words
-        else response.duration,
-    }
+    if use_cache:
+        cache.put(cache_key, [words, text_segment])
+    if journal:
+        journal.record(cache_key, [words, text_segment])
 
     return words, text_segment
 
 
-def transcribe_large_audio(audio_path, output_file):
+def transcribe_large_audio(
+    audio_path,
+    output_file,
+    use_cache=True,
+    chunking="silence",
+    max_chunk_bytes=MAX_CHUNK_BYTES,
+    max_chunk_sec=None,
+    strip_silence=False,
+    upload_profile="original",
+    backend="fireworks",
+):
     """
     Handle large audio files by splitting into chunks and processing in parallel.
 
     Args:
         audio_path (str): Path to input audio file
         output_file (str): Path to save JSONL transcription output
+        use_cache (bool): Whether to reuse cached chunk transcriptions
+        chunking (str): "silence" to cut at quiet points under the upload size
+            limit, or "fixed" for 10 minute chunks with 10 second overlap
+        max_chunk_bytes (int): Upload size limit for "silence" chunking
+        max_chunk_sec (float): Optional duration limit for "silence" chunking
+        strip_silence (bool): Only upload speech, leaving out long silences
+            and music beds
+        upload_profile (str): How to encode chunks for upload, from UPLOAD_PROFILES
+        backend (str): Name of the transcription backend, from BACKENDS
 
     Processing details:
-    - Splits audio into 10 minute chunks with 10 second overlap
+    - Splits audio into chunks as planned by the chunking mode; chunks only
+      overlap where no clean silence was found to cut at
+    - Cuts chunks on MP3 frame boundaries and uploads their frames as-is,
+      without decoding or re-encoding the episode
+    - Optionally drops non-speech audio before chunking, and maps word
+      timestamps back to the original episode afterwards
+    - Optionally re-encodes chunks to a compact speech profile for upload
     - Uses temporary directory for chunk storage
-    - Processes chunks in parallel using lox threads
+    - Processes chunks in parallel on the shared work queue, longest first
+    - Journals each finished chunk, so an interrupted run resumes where it stopped
     - Adjusts timestamps to account for chunk offsets
     - Saves results in JSONL format with word-level timestamps
     """
-    # Number of words to overlap between chunks
-    OVERLAP_WORDS = 10
-
-    audio = AudioSegment.from_file(audio_path)
-    total_duration_ms = len(audio)
-    print(f"Total duration: {total_duration_ms/(1000*60):.1f} minutes")
-
-    # Start with a chunk size that's safely under 25MB (e.g., 10 minutes)
-    chunk_duration_ms = 10 * 60 * 1000  # 10 minutes in milliseconds
-
-    # Precompute all chunk positions
-    chunk_positions = []
-    current_position_ms = 0
-    while current_position_ms < total_duration_ms:
-        chunk_positions.append(current_position_ms)
-        current_position_ms += chunk_duration_ms - 10 * 1000
-
-    ###
-    # chunk_positions = chunk_positions[:1]
-
-    # Create temporary directory for chunk files
-    with tempfile.TemporaryDirectory() as temp_dir:
-        for current_position_ms in chunk_positions:
+    # Finished chunks are journaled next to the output until it is written
+    journal = Journal(Path(output_file).with_suffix(".journal.jsonl"))
+    if len(journal):
+        print(f"Resuming from {journal.path} with {len(journal)} finished chunks")
+
+    # Bytes of audio sent to the API, to compare upload profiles
+    upload_stats = dict(original=0, uploaded=0)
+
+    offset_map = None
+    with ExitStack() as stack:
+        temp_dir = stack.enter_context(tempfile.TemporaryDirectory())
+
+        # Memory-map the episode and index its frames, so each chunk is a
+        # zero-copy slice of the file rather than decoded PCM
+        mp3 = stack.enter_context(open_mp3(audio_path))
+        index = cached_frame_index(audio_path, mp3)
+        print(f"Total duration: {index.duration/60:.1f} minutes")
+
+        if strip_silence:
+            # Transcribe a speech-only copy, and map its times back afterwards
+            spans = speech_spans(mp3, index) or [(0, len(index))]
+            speech_path = os.path.join(temp_dir, "speech.mp3")
+            offset_map = write_speech(mp3, index, spans, speech_path)
+            mp3 = stack.enter_context(open_mp3(speech_path))
+            index = scan_frames(mp3)
+
+        total_duration_ms = index.duration * 1000
+
+        if chunking == "fixed":
+            # 10 minute chunks are safely under 25MB
+            plan = plan_fixed_chunks(index, chunk_sec=10 * 60, overlap_sec=10)
+        else:
+            max_bytes, max_sec = max_chunk_bytes, max_chunk_sec
+            profile = UPLOAD_PROFILES[upload_profile]
+            if profile:
+                # Re-encoded chunks are much smaller than the original frames,
+                # so the upload limit allows longer chunks
+                limit_sec = 0.95 * max_chunk_bytes * 8 / profile["bitrate"]
+                max_bytes = len(mp3)
+                max_sec = min(max_sec or limit_sec, limit_sec)
+            plan = plan_silence_chunks(mp3, index, max_bytes=max_bytes, max_sec=max_sec)
+        print(f"Planned {len(plan)} chunks")
+
+        ###
+        # plan = plan[:1]
+
+        # Chunk start times in ms, on the frame boundaries
+        chunk_positions = []
+        chunk_keys = []
+        batch = work_queue.batch()
+        for start_frame, end_frame in plan:
+            start_byte = index.offsets[start_frame]
+            end_byte = index.offsets[end_frame]
+            start_sec = index.frame_time(start_frame)
+            end_sec = index.frame_time(end_frame)
+
+            current_position_ms = start_sec * 1000
+            chunk_positions.append(current_position_ms)
             print()
             dump(current_position_ms)
 
-            # Extract chunk with overlap
-            chunk_end = min(current_position_ms + chunk_duration_ms, total_duration_ms)
-
             # Calculate and display progress
             percent_complete = (current_position_ms / total_duration_ms) * 100
             print(f"\nProgress: {percent_complete:.1f}% done chunking file")
-            print(
-                f"Extracting chunk from {current_position_ms/1000:.2f}s to {chunk_end/1000:.2f}s"
-            )
-            chunk = audio[current_position_ms:chunk_end]
+            print(f"Extracting chunk from {start_sec:.2f}s to {end_sec:.2f}s")
+            chunk = mp3[start_byte:end_byte]
+
+            key = chunk_key(chunk, upload_profile, backend)
+            chunk_keys.append(key)
+            if key in journal:
+                print("Chunk already transcribed, found in journal")
+                continue
 
             # Save chunk to unique temp file
-            temp_path = os.path.join(temp_dir, f"chunk_{current_position_ms}.mp3")
+            temp_path = os.path.join(temp_dir, f"chunk_{start_frame}.mp3")
             dump(temp_path)
 
             # Transcribe chunk
-            print("Sending chunk to OpenAI API for transcription...")
-            transcribe_audio.scatter(chunk, temp_path)
+            print(f"Sending chunk to {backend} for transcription...")
+            batch.submit(
+                transcribe_audio,
+                chunk,
+                temp_path,
+                use_cache,
+                journal,
+                upload_profile,
+                backend,
+                upload_stats,
+                cost=(end_sec - start_sec) * WORDS_PER_SECOND,
+            )
+
+        try:
+            batch.gather(tqdm=True)
+        except Exception:
+            print()
+            print(
+                f"Transcription failed with {len(journal)} of {len(chunk_keys)}"
+                f" chunks saved to {journal.path}"
+            )
+            print("Rerun to resume from the journal")
+            raise
+
+    # Build the output from the journal, in chunk order
+    results = [tuple(journal.get(key)) for key in chunk_keys]
 
-        results = transcribe_audio.gather(tqdm=True)
+    if use_cache:
+        print_stats(cache.stats())
+
+    if upload_stats["original"]:
+        print(
+            f"Uploaded {upload_stats['uploaded']/(1024*1024):.1f}MB"
+            f" as {upload_profile}, for"
+            f" {upload_stats['original']/(1024*1024):.1f}MB of original audio"
+            f" ({100 * upload_stats['uploaded'] / upload_stats['original']:.0f}%)"
+        )
 
     with jsonlines.open(output_file, mode="w", flush=True) as writer:
         for current_position_ms, (chunk_words, chunk_text) in zip(
@@ -170,12 +353,44 @@ def transcribe_large_audio(audio_path, output_file):
             chunk_text["start"] += current_position_ms / 1000
             chunk_text["end"] += current_position_ms / 1000
 
+            # Map speech-only times back to the original episode
+            if offset_map:
+                for obj in chunk_words + [chunk_text]:
+                    obj["start"] = round(offset_map.original_time(obj["start"]), 6)
+                    obj["end"] = round(offset_map.original_time(obj["end"]), 6)
+
             for word in chunk_words:
                 writer.write(word)
             writer.write(chunk_text)
 
             print(f"Processed up to {current_position_ms/1000:.2f} seconds")
 
+    journal.remove()
+
+
+def transcribe_file(audio_path, output_file, output_text, **options):
+    """
+    Transcribe one episode and write its JSONL and wrapped text outputs.
+
+    Args:
+        audio_path (str): Path to the episode MP3
+        output_file (str): Path to save JSONL transcription output
+        output_text (str): Path to save the word-wrapped text
+        **options: Passed on to transcribe_large_audio
+    """
+    transcribe_large_audio(audio_path, output_file, **options)
+
+    # Create text file with wrapped text
+    with open(output_text, "w") as txt_file:
+        with jsonlines.open(output_file) as reader:
+            for obj in reader:
+                if obj.get("text"):
+                    # Wrap text at 80 columns
+                    wrapped_text = textwrap.fill(obj["text"], width=80)
+                    txt_file.write(wrapped_text + "\n\n")
+
+    print(f"Transcription saved to {output_file} and {output_text}")
+
 
 def print_words(words_and_text):
     """
@@ -212,14 +427,54 @@ def main():
     - Output file generation
     """
     parser = argparse.ArgumentParser(
-        description="Transcribe audio files using Whisper API with word-level timestamps"
+        description="Transcribe audio files using Whisper with word-level timestamps"
     )
     parser.add_argument("files", nargs="+", help="Audio files to transcribe")
     parser.add_argument(
         "--force", action="store_true", help="Overwrite existing transcription files"
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Re-transcribe every chunk, ignoring cached transcriptions",
+    )
+    parser.add_argument(
+        "--chunking",
+        choices=["silence", "fixed"],
+        default="silence",
+        help="Cut chunks at quiet points (default) or every 10 minutes",
+    )
+    parser.add_argument(
+        "--max-chunk-mb",
+        type=float,
+        default=MAX_CHUNK_BYTES / (1024 * 1024),
+        help="Maximum upload size of a chunk in MB, for silence chunking",
+    )
+    parser.add_argument(
+        "--max-chunk-minutes",
+        type=float,
+        help="Maximum duration of a chunk in minutes, for silence chunking",
+    )
+    parser.add_argument(
+        "--strip-silence",
+        action="store_true",
+        help="Only upload speech, leaving out long silences and music beds",
+    )
+    parser.add_argument(
+        "--upload-profile",
+        choices=list(UPLOAD_PROFILES),
+        default="original",
+        help="Encoding for uploaded chunks (default: the episode's own MP3 frames)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=list(BACKENDS),
+        default="fireworks",
+        help="Transcription backend; local runs faster-whisper on this machine",
+    )
     args = parser.parse_args()
 
+    episodes = []
     for audio_path in args.files:
         # Create output file with same path prefix but new suffix
         base_path = Path(audio_path).with_suffix("")
@@ -238,20 +493,27 @@ def main():
             print("Use --force to overwrite existing files")
             continue
 
-        # Create output file paths once
-        input_path = Path(audio_path)
-        transcribe_large_audio(audio_path, output_file)
+        episodes.append((audio_path, output_file, output_text))
+
+    options = dict(
+        use_cache=not args.no_cache,
+        chunking=args.chunking,
+        max_chunk_bytes=int(args.max_chunk_mb * 1024 * 1024),
+        max_chunk_sec=args.max_chunk_minutes * 60 if args.max_chunk_minutes else None,
+        strip_silence=args.strip_silence,
+        upload_profile=args.upload_profile,
+        backend=args.backend,
+    )
+
+    # Transcribe all the episodes at once, sharing one queue of chunks
+    failed = run_episodes(
+        transcribe_file, episodes, max_episodes=MAX_EPISODES, **options
+    )
 
-        # Create text file with wrapped text
-        with open(output_text, "w") as txt_file:
-            with jsonlines.open(output_file) as reader:
-                for obj in reader:
-                    if obj.get("text"):
-                        # Wrap text at 80 columns
-                        wrapped_text = textwrap.fill(obj["text"], width=80)
-                        txt_file.write(wrapped_text + "\n\n")
+    llm.print_metrics()
 
-        print(f"Transcription saved to {output_file} and {output_text}")
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":